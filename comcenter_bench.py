@@ -0,0 +1,606 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from comcenter_jsonio import write_json
+
+# Офлайн-бенчмарк: локальный сервер-заменитель comcenter.ru с синтетическими страницами
+# и записанным прайс-листом, прогон действий 1-8 и замер скорости, CPU и пиковой памяти.
+# Сервер работает в отдельном процессе, чтобы замеры относились только к парсеру
+
+default_xls = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_price.xls")
+
+PRINTER_ID_BASE = 500000000000
+
+def load_price_ids(xls_file):
+    """12-значные коды товаров из прайс-листа"""
+    from comcenter_parser import iter_xls_rows, xls_code
+    return sorted({code for _, values in iter_xls_rows(xls_file) for code in map(xls_code, values) if code})
+
+class StandInSite:
+    """Синтетические данные сайта: принтеры, их картриджи и запчасти, страницы товаров"""
+    def __init__(self, xls_file, printers=200, per_printer=8, seed=1):
+        rng = random.Random(seed)
+        with open(xls_file, 'rb') as f:
+            self.xls_bytes = f.read()
+        self.xls_etag = '"' + hashlib.sha256(self.xls_bytes).hexdigest()[:16] + '"'
+        stock_ids = load_price_ids(xls_file)
+        # Часть совместимых товаров отсутствует в прайсе (нет в наличии)
+        missing_ids = [str(PRINTER_ID_BASE + 100000 + i) for i in range(max(1, len(stock_ids) // 4))]
+        pool = stock_ids + missing_ids
+        self.printer_ids = [str(PRINTER_ID_BASE + i) for i in range(printers)]
+        self.compatibility = {}
+        for printer_id in self.printer_ids:
+            items = rng.sample(pool, min(per_printer, len(pool)))
+            half = len(items) // 2
+            self.compatibility[printer_id] = (items[:half], items[half:])
+        self.rng = rng
+
+    def browse_page(self):
+        links = "".join(
+            f'<a class="cells-wrapper" href="/Store/Details/{printer_id}">Принтер {printer_id}</a>'
+            for printer_id in self.printer_ids
+        )
+        return f"<html><body><div class=\"grid\">{links}</div></body></html>"
+
+    def printer_page(self, printer_id):
+        cartridges, parts = self.compatibility[printer_id]
+        def grid(title, ids):
+            links = "".join(f'<a class="cells-wrapper" href="/Store/Details/{i}">{i}</a>' for i in ids)
+            return (f'<div class="grid space-top"><div class="grid-header"><h2 class="title">{title}</h2></div>'
+                    f'<div class="grid-body">{links}</div></div>')
+        return f"<html><body>{grid('Картриджи', cartridges)}{grid('Запчасти', parts)}</body></html>"
+
+    def product_page(self, product_id):
+        # Детерминированные значения по ID, чтобы повторные запуски давали одинаковые страницы
+        n = int(product_id)
+        retail = 100 + n % 5000 + (n % 97) / 100
+        wholesale = round(retail * 0.9, 2)
+        rows = "".join(
+            f"<tr><td>{key}</td><td>{value}</td></tr>"
+            for key, value in (
+                ("Тип товара", ("Картридж", "Фотобарабан", "Ракель", "Вал заряда")[n % 4]),
+                ("Бренд", ("HP", "Canon", "Kyocera", "Brother")[n % 3]),
+                ("Производитель", "Булат"),
+                ("Для использования с принтерами/МФУ, совместимость", f"LJ P{1000 + n % 900}"),
+                ("Ресурс, стр A4", str(1000 + n % 10000)),
+            )
+        )
+        filler = "<p>" + "Описание товара. " * 40 + "</p>"
+        return (
+            "<html><head><title>Comcenter</title></head><body>"
+            f'<div class="grid-body text-left space-top-tiny"><h1>Товар {product_id}</h1></div>'
+            f'<span class="product-count">{n % 50}</span>'
+            f'<div class="product-price-container"><span data-bind="text: getBrowsingPrice({retail:.2f}, {wholesale})"></span></div>'
+            f'<div class="product-properties-container"><table class="price-list">{rows}</table></div>'
+            f'<div class="grid space-top"><div class="grid-body text-left space-top-tiny">{filler}</div></div>'
+            "</body></html>"
+        )
+
+def make_handler(site, latency, jitter, error_rate, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send(self, status, body, content_type="text/html; charset=utf-8", extra_headers=None):
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            self.send_response(status)
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def delay_or_fail(self, inject_errors=True):
+            # Ошибки внедряются только в страницы товаров, иначе падает весь запуск на входе
+            with lock:
+                delay = latency + rng.uniform(0, jitter)
+                fail = inject_errors and rng.random() < error_rate
+            if delay:
+                time.sleep(delay)
+            if fail:
+                self.send(503, "Service Unavailable")
+                return True
+            return False
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            match = re.match(r'^/Store/Details/(\d{12})$', path)
+            if self.delay_or_fail(inject_errors=bool(match)):
+                return
+            if path == "/":
+                self.send(200, "<html><body>Comcenter</body></html>")
+            elif path.startswith("/Store/Browse/"):
+                self.send(200, site.browse_page())
+            elif match and match.group(1) in site.compatibility:
+                self.send(200, site.printer_page(match.group(1)))
+            elif match:
+                self.send(200, site.product_page(match.group(1)))
+            elif path == "/Content/PriceList/price.xls":
+                if self.headers.get("If-None-Match") == site.xls_etag:
+                    self.send(304, b"")
+                else:
+                    self.send(200, site.xls_bytes, "application/vnd.ms-excel", {"ETag": site.xls_etag})
+            else:
+                self.send(404, "Not Found")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if self.delay_or_fail(inject_errors=False):
+                return
+            if self.path == "/Account/LogOn":
+                self.send(200, "<html><body><h1>Добро пожаловать</h1></body></html>")
+            else:
+                self.send(404, "Not Found")
+
+    return Handler
+
+def serve(options, port_queue):
+    """Точка входа процесса сервера"""
+    site = StandInSite(options["xls_file"], options["printers"], options["per_printer"], options["seed"])
+    handler = make_handler(site, options["latency"], options["jitter"], options["error_rate"], options["seed"])
+    server = ThreadingHTTPServer(("127.0.0.1", options.get("port", 0)), handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+class StandInServer:
+    """Запуск сервера-заменителя в отдельном процессе (контекстный менеджер)"""
+    def __init__(self, **options):
+        self.options = options
+
+    def __enter__(self):
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(self.options, port_queue), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+class BenchOutputHandler:
+    """Тихий обработчик вывода: считает ошибки, лог пишет только при verbose"""
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.errors = 0
+
+    def log(self, message):
+        if message.startswith("Ошибка"):
+            self.errors += 1
+        if self.verbose:
+            print(message)
+
+    def progress(self, current, total):
+        pass
+
+def count_items(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as f:
+        return len(json.load(f))
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ: resource (Unix), иначе psutil (Windows); None, если измерить нельзя"""
+    import sys
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        # ru_maxrss в Linux в килобайтах, в macOS - в байтах
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024, 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return round(getattr(info, "peak_wset", info.rss) / 2**20, 1)
+
+def format_mb(value):
+    return f"{value} МБ" if value is not None else "н/д"
+
+def run_crawl_action(url, choice, verbose=False):
+    """Прогон одного действия парсера против сервера url в текущем процессе, отчет по действию"""
+    import comcenter_parser as cp
+
+    cp.base_url = url
+    cp.cert_path = os.path.abspath(__file__)  # для http проверка сертификата не выполняется
+    os.environ["COMCENTER.RU_LOGIN"] = "bench"
+    os.environ["COMCENTER.RU_PASSWORD"] = "bench"
+
+    outputs = {
+        "1": cp.printers_output_file,
+        "2": cp.xls_output_file,
+        "3": cp.compatibility_output_file,
+        "4": cp.compatibility_actual_output_file,
+        "5": cp.cartridges_parts_output_file,
+        "6": cp.all_cartridges_parts_output_file,
+        "7": cp.comcenter_products_output_file,
+        "8": cp.comcenter_products_output_file,
+    }
+    output_handler = BenchOutputHandler(verbose)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    cp.run_action(choice, output_handler, cp.CancelFlag())
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    items = count_items(outputs[choice])
+    return {
+        "action": choice,
+        "items": items,
+        "errors": output_handler.errors,
+        "wall_sec": round(wall, 3),
+        "cpu_sec": round(cpu, 3),
+        "items_per_sec": round(items / wall, 2) if wall > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_crawl_benchmark(url, actions, verbose=False):
+    """Прогон действий парсера против сервера url, возвращает отчет по каждому действию
+
+    Каждое действие выполняется в новом процессе интерпретатора (в текущей папке):
+    ru_maxrss - пик за все время процесса, и в общем процессе пик RSS следующих
+    действий включал бы пик предыдущих.
+    """
+    import subprocess
+    import sys
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for choice in actions:
+        code = (
+            "import json, sys\n"
+            f"sys.path.insert(0, {repo_dir!r})\n"
+            "from comcenter_bench import run_crawl_action\n"
+            f"print(json.dumps(run_crawl_action({url!r}, {choice!r}, {verbose!r})))\n"
+        )
+        completed = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True, check=True)
+        lines = completed.stdout.strip().splitlines()
+        if verbose:
+            print("\n".join(lines[:-1]))
+        results.append(json.loads(lines[-1]))
+    return results
+
+# Замеры запуска: каждый выполняется в новом процессе интерпретатора
+STARTUP_SCRIPTS = {
+    # Время до появления консольного меню
+    "parser_import": "import comcenter_parser",
+    "gui_import": "import comcenter_gui",
+    # Время до первой отрисовки окна (только при наличии дисплея)
+    "gui_window": (
+        "import tkinter as tk, comcenter_gui\n"
+        "root = tk.Tk()\n"
+        "app = comcenter_gui.ComcenterGUI(root)\n"
+        "root.update()\n"
+    ),
+}
+
+def run_startup_benchmark(repeat=5):
+    """Медиана времени запуска по STARTUP_SCRIPTS, мс"""
+    import statistics
+    import subprocess
+    import sys
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, script in STARTUP_SCRIPTS.items():
+        if name == "gui_window" and not os.environ.get("DISPLAY"):
+            continue
+        code = (
+            "import time\n_start = time.perf_counter()\n" + script +
+            "\nprint((time.perf_counter() - _start) * 1000)\n"
+        )
+        timings = []
+        for _ in range(repeat):
+            completed = subprocess.run([sys.executable, "-c", code], cwd=repo_dir, capture_output=True, text=True, check=True)
+            timings.append(float(completed.stdout.strip().splitlines()[-1]))
+        results[name] = {"median_ms": round(statistics.median(timings), 1), "max_ms": round(max(timings), 1)}
+    return results
+
+# Чтение прайс-листа (12-значные коды и остатки) прежним способом через pandas и потоковым
+# через xlrd; каждый замер - в новом процессе, чтобы пиковая память не смешивалась
+XLS_READER_SCRIPTS = {
+    "pandas": (
+        "import re, xlrd, pandas as pd\n"
+        "_start = time.perf_counter()\n"
+        "xls = pd.ExcelFile(path)\n"
+        "ids, stock = [], {}\n"
+        "for sheet_name in xls.sheet_names:\n"
+        "    df = pd.read_excel(xls, sheet_name=sheet_name, dtype=str)\n"
+        "    for column in df.columns:\n"
+        "        ids.extend(v for v in df[column] if isinstance(v, str) and re.match(r'^\\d{12}$', v))\n"
+        "    if len(df.columns) >= 6:\n"
+        "        for _, row in df.iterrows():\n"
+        "            if isinstance(row.iloc[2], str) and re.match(r'^\\d{12}$', row.iloc[2]):\n"
+        "                stock[row.iloc[2]] = (row.iloc[4], row.iloc[5])\n"
+    ),
+    "xlrd_stream": (
+        "import xlrd, comcenter_parser as cp\n"
+        "_start = time.perf_counter()\n"
+        "ids, stock = [], {}\n"
+        "for _, values in cp.iter_xls_rows(path):\n"
+        "    ids.extend(c for c in map(cp.xls_code, values) if c)\n"
+        "for _, (code, availability, in_transit) in cp.iter_xls_rows(path, columns=(2, 4, 5)):\n"
+        "    if cp.xls_code(code):\n"
+        "        stock[cp.xls_code(code)] = (cp.xls_count(availability), cp.xls_count(in_transit))\n"
+    ),
+}
+
+def run_xls_reader_benchmark(xls_file, repeat=3):
+    """Чтение прайс-листа по XLS_READER_SCRIPTS: медиана времени и пик RSS по repeat запускам
+    и пик памяти, выделенной при чтении (tracemalloc, отдельный запуск)"""
+    import statistics
+    import subprocess
+    import sys
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, script in XLS_READER_SCRIPTS.items():
+        runs = []
+        traced = None
+        for trace in [False] * repeat + [True]:
+            code = (
+                "import json, time, tracemalloc\n"
+                "from comcenter_bench import peak_rss_mb as rss\n"
+                f"path = {os.path.abspath(xls_file)!r}\n" +
+                script.replace("_start = time.perf_counter()", ("tracemalloc.start(); " if trace else "") + "_start = time.perf_counter()") +
+                "print(json.dumps({'ms': (time.perf_counter() - _start) * 1000, 'peak_rss_mb': rss(), "
+                "'alloc_peak_mb': tracemalloc.get_traced_memory()[1] / 2**20, 'ids': len(ids), 'stock': len(stock)}))\n"
+            )
+            completed = subprocess.run([sys.executable, "-c", code], cwd=repo_dir, capture_output=True, text=True, check=True)
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            if trace:
+                traced = result
+            else:
+                runs.append(result)
+        rss_values = [r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None]
+        results[name] = {
+            "median_ms": round(statistics.median(r["ms"] for r in runs), 1),
+            "peak_rss_mb": round(statistics.median(rss_values), 1) if rss_values else None,
+            "alloc_peak_mb": round(traced["alloc_peak_mb"], 2),
+            "ids": runs[0]["ids"],
+            "stock": runs[0]["stock"],
+        }
+    return results
+
+def serve_catalog(port_queue):
+    """Точка входа процесса сервиса запросов (comcenter_service) для нагрузочного теста"""
+    from comcenter_service import CatalogService, make_server
+    server = make_server(CatalogService(BenchOutputHandler()), port=0)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+def run_service_benchmark(duration=5.0, clients=8, seed=1):
+    """Нагрузочный тест comcenter_service на текущих базах в COMCENTER.ru_database
+
+    Возвращает время прямого поиска в памяти и скорость/задержки HTTP-запросов.
+    """
+    import http.client
+    from comcenter_metrics import percentile
+    from comcenter_service import CatalogService
+
+    # Поиск в памяти без HTTP
+    service = CatalogService(BenchOutputHandler())
+    store = service.store
+    printer_ids = list(store.compatibility)
+    product_ids = store.product_ids()
+    if not printer_ids or not product_ids:
+        raise SystemExit("Нет данных для нагрузочного теста: нужны PRINTERS_compatibility.json и базы товаров")
+    rng = random.Random(seed)
+    lookups = [rng.choice(printer_ids) for _ in range(10000)]
+    start = time.perf_counter()
+    for printer_id in lookups:
+        store.printer(printer_id)
+    in_memory_us = (time.perf_counter() - start) / len(lookups) * 1e6
+
+    paths = (
+        [f"/printers/{i}" for i in printer_ids] +
+        [f"/printers/{i}?in_stock=1" for i in printer_ids] +
+        [f"/products/{i}" for i in product_ids] +
+        [f"/products/{i}/printers" for i in product_ids]
+    )
+
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_catalog, args=(port_queue,), daemon=True)
+    process.start()
+    port = port_queue.get(timeout=60)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(client_seed):
+        client_rng = random.Random(client_seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        local = []
+        while time.perf_counter() < deadline:
+            path = client_rng.choice(paths)
+            request_start = time.perf_counter()
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            local.append(time.perf_counter() - request_start)
+            if response.status != 200:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    try:
+        threads = [threading.Thread(target=client, args=(seed + i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.join()
+
+    latencies.sort()
+    return {
+        "in_memory_lookup_us": round(in_memory_us, 2),
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_sec": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+def measure_load(load):
+    """Время и память, занятая результатом загрузки (tracemalloc)"""
+    import gc
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"load_ms": round(elapsed * 1000, 2), "retained_mb": round(retained / 2**20, 3), "peak_mb": round(peak / 2**20, 3)}
+
+def run_compact_benchmark():
+    """Сравнение загрузки баз в словари JSON и в компактное представление comcenter_compact"""
+    from comcenter_compact import CompactCompatibility, ProductTable, save_cache, load_cache
+    from comcenter_parser import compatibility_output_file, all_cartridges_parts_output_file
+
+    def load_dict(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    report = {}
+    workdir = tempfile.mkdtemp(prefix="comcenter_compact_")
+    try:
+        for cls, path in ((CompactCompatibility, compatibility_output_file), (ProductTable, all_cartridges_parts_output_file)):
+            if not os.path.exists(path):
+                continue
+            cache_path = os.path.join(workdir, cls.__name__ + ".cache")
+            save_cache(cls.load_json(path), cache_path)
+            report[os.path.basename(path)] = {
+                "json_dict": measure_load(lambda: load_dict(path)),
+                "compact_from_json": measure_load(lambda: cls.load_json(path)),
+                "compact_from_cache": measure_load(lambda: load_cache(cache_path)),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if not report:
+        raise SystemExit("Нет данных: нужны PRINTERS_compatibility.json и DATABASE_all_cartridges&Parts.json")
+    return report
+
+def bench_main():
+    """Консольный запуск бенчмарка"""
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк парсера Comcenter")
+    parser.add_argument("--actions", default="1,2,3,4,5,6,7,8", help="действия через запятую")
+    parser.add_argument("--printers", type=int, default=200, help="число синтетических принтеров")
+    parser.add_argument("--per-printer", type=int, default=8, help="совместимых товаров на принтер")
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--xls", default=default_xls, help="прайс-лист, отдаваемый сервером")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл для JSON-отчета")
+    parser.add_argument("--verbose", action="store_true", help="выводить лог парсера")
+    parser.add_argument("--serve", action="store_true", help="только запустить сервер и ждать")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--startup", action="store_true", help="замерить время запуска GUI и консольного меню")
+    parser.add_argument("--service", action="store_true", help="нагрузочный тест сервиса запросов comcenter_service")
+    parser.add_argument("--duration", type=float, default=5.0, help="длительность нагрузочного теста, с")
+    parser.add_argument("--clients", type=int, default=8, help="число параллельных клиентов нагрузочного теста")
+    parser.add_argument("--compact", action="store_true", help="сравнить память и время загрузки баз в компактном представлении")
+    parser.add_argument("--xls-reader", action="store_true", help="сравнить чтение прайс-листа --xls через pandas и потоково через xlrd")
+    args = parser.parse_args()
+
+    if args.xls_reader:
+        report = run_xls_reader_benchmark(args.xls)
+        for name, r in report.items():
+            print(f"{name}: {r['median_ms']} мс, пик RSS {format_mb(r['peak_rss_mb'])}, пик памяти при чтении {r['alloc_peak_mb']} МБ, "
+                  f"кодов {r['ids']}, остатков {r['stock']}")
+        if args.output:
+            write_json(args.output, report)
+        return
+
+    if args.compact:
+        report = run_compact_benchmark()
+        for name, r in report.items():
+            for mode, m in r.items():
+                print(f"{name} [{mode}]: загрузка {m['load_ms']} мс, память {m['retained_mb']} МБ, пик {m['peak_mb']} МБ")
+        if args.output:
+            write_json(args.output, report)
+        return
+
+    if args.service:
+        report = run_service_benchmark(args.duration, args.clients, args.seed)
+        print(f"Поиск в памяти: {report['in_memory_lookup_us']} мкс; HTTP: {report['requests_per_sec']} запросов/с, "
+              f"p50 {report['p50_ms']} мс, p95 {report['p95_ms']} мс, p99 {report['p99_ms']} мс, ошибок {report['errors']}")
+        if args.output:
+            write_json(args.output, report)
+        return
+
+    if args.startup:
+        report = run_startup_benchmark()
+        for name, r in report.items():
+            print(f"{name}: медиана {r['median_ms']} мс, максимум {r['max_ms']} мс")
+        if args.output:
+            write_json(args.output, report)
+        return
+
+    options = {
+        "xls_file": os.path.abspath(args.xls),
+        "printers": args.printers,
+        "per_printer": args.per_printer,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "seed": args.seed,
+        "port": args.port,
+    }
+    if args.serve:
+        with StandInServer(**options) as server:
+            print(f"Сервер запущен: {server.url}")
+            try:
+                server.process.join()
+            except KeyboardInterrupt:
+                pass
+        return
+
+    # Парсер пишет результаты относительно текущей папки - работаем во временной
+    workdir = tempfile.mkdtemp(prefix="comcenter_bench_")
+    cwd = os.getcwd()
+    try:
+        with StandInServer(**options) as server:
+            os.chdir(workdir)
+            results = run_crawl_benchmark(server.url, [a.strip() for a in args.actions.split(",") if a.strip()], args.verbose)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"options": options, "results": results}
+    for r in results:
+        print(f"Действие {r['action']}: {r['items']} элементов, {r['items_per_sec']}/с, "
+              f"CPU {r['cpu_sec']} с, пик RSS {format_mb(r['peak_rss_mb'])}, ошибок {r['errors']}")
+    if args.output:
+        write_json(args.output, report)
+
+if __name__ == "__main__":
+    bench_main()
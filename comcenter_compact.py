@@ -0,0 +1,345 @@
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_left
+
+from comcenter_jsonio import write_json, write_file
+
+# Компактное представление баз в памяти:
+# - ID хранятся как 64-битные целые в array('q') (вместо строк по 12 символов);
+# - совместимость принтер <-> товар - смежность в формате CSR (смещения + индексы),
+#   в обе стороны;
+# - товары хранятся по столбцам, ключи характеристик заносятся в общую таблицу,
+#   повторяющиеся значения интернируются; ProductRecord (__slots__) создается при обращении.
+# Есть загрузка из JSON-форматов парсера и запись обратно, а также бинарный кэш:
+# строка-заголовок в JSON и сырые байты массивов (строки - в JSON). Кэш загружается
+# в разы быстрее JSON и, в отличие от pickle, не может выполнить код при чтении.
+# Используется сервисом запросов (comcenter_service)
+
+ID_LENGTH = 12
+ID_FORMAT = f"%0{ID_LENGTH}d"
+CACHE_VERSION = 2
+CACHE_MAGIC = b"COMCENTER-COMPACT\n"
+CACHE_TYPECODES = ("q", "l", "d", "H")
+
+def id_to_int(product_id):
+    if len(product_id) != ID_LENGTH or not product_id.isdigit():
+        raise ValueError(f"Некорректный ID: {product_id!r}")
+    return int(product_id)
+
+def int_to_id(value):
+    return ID_FORMAT % value
+
+def sorted_id_array(product_ids):
+    """Отсортированные ID (строки) и их массив; ID одинаковой длины из цифр сортируются как числа"""
+    ordered = sorted(product_ids)
+    for product_id in ordered:
+        if len(product_id) != ID_LENGTH or not product_id.isdigit():
+            raise ValueError(f"Некорректный ID: {product_id!r}")
+    return ordered, array('q', map(int, ordered))
+
+def find_index(sorted_ids, product_id):
+    """Индекс ID в отсортированном массиве или -1"""
+    value = id_to_int(product_id)
+    index = bisect_left(sorted_ids, value)
+    if index < len(sorted_ids) and sorted_ids[index] == value:
+        return index
+    return -1
+
+class CompactCompatibility:
+    """Совместимость принтеров с картриджами и запчастями (формат PRINTERS_compatibility*.json)"""
+    __slots__ = ("printer_ids", "product_ids", "cartridge_offsets", "cartridge_targets",
+                 "part_offsets", "part_targets", "reverse_offsets", "reverse_targets")
+    # Списки строк, которые после чтения кэша снова интернируются
+    interned = ()
+
+    @classmethod
+    def from_json(cls, data):
+        self = cls()
+        printers, self.printer_ids = sorted_id_array(data)
+        products = set()
+        for entry in data.values():
+            products.update(entry.get("cartridges", ()))
+            products.update(entry.get("parts", ()))
+        products, self.product_ids = sorted_id_array(products)
+        product_index = {product_id: i for i, product_id in enumerate(products)}
+
+        # Строки CSR заполняются сразу по порядку принтеров, без промежуточных списков пар
+        self.cartridge_offsets = array('q', [0])
+        self.cartridge_targets = array('l')
+        self.part_offsets = array('q', [0])
+        self.part_targets = array('l')
+        # Обратная смежность товар -> принтеры (картриджи и запчасти вместе, без повторов);
+        # принтеры перебираются по возрастанию, поэтому списки уже упорядочены
+        reverse = [[] for _ in products]
+        for row, printer in enumerate(printers):
+            entry = data[printer]
+            cartridges = [product_index[p] for p in entry.get("cartridges", ())]
+            parts = [product_index[p] for p in entry.get("parts", ())]
+            self.cartridge_targets.extend(cartridges)
+            self.cartridge_offsets.append(len(self.cartridge_targets))
+            self.part_targets.extend(parts)
+            self.part_offsets.append(len(self.part_targets))
+            for column in set(cartridges).union(parts):
+                reverse[column].append(row)
+
+        self.reverse_offsets = array('q', [0])
+        self.reverse_targets = array('l')
+        for rows in reverse:
+            self.reverse_targets.extend(rows)
+            self.reverse_offsets.append(len(self.reverse_targets))
+        return self
+
+    @classmethod
+    def load_json(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+    def __len__(self):
+        return len(self.printer_ids)
+
+    def __contains__(self, printer_id):
+        return find_index(self.printer_ids, printer_id) != -1
+
+    def __iter__(self):
+        for printer in self.printer_ids:
+            yield int_to_id(printer)
+
+    def _row(self, offsets, targets, row):
+        product_ids = self.product_ids
+        return [ID_FORMAT % product_ids[i] for i in targets[offsets[row]:offsets[row + 1]]]
+
+    def entry(self, printer_id):
+        """(картриджи, запчасти) принтера одним поиском или None"""
+        row = find_index(self.printer_ids, printer_id)
+        if row == -1:
+            return None
+        return (self._row(self.cartridge_offsets, self.cartridge_targets, row),
+                self._row(self.part_offsets, self.part_targets, row))
+
+    def cartridges(self, printer_id):
+        row = find_index(self.printer_ids, printer_id)
+        return self._row(self.cartridge_offsets, self.cartridge_targets, row) if row != -1 else []
+
+    def parts(self, printer_id):
+        row = find_index(self.printer_ids, printer_id)
+        return self._row(self.part_offsets, self.part_targets, row) if row != -1 else []
+
+    def printers_for(self, product_id):
+        column = find_index(self.product_ids, product_id)
+        if column == -1:
+            return []
+        start, end = self.reverse_offsets[column], self.reverse_offsets[column + 1]
+        return [int_to_id(self.printer_ids[i]) for i in self.reverse_targets[start:end]]
+
+    def to_json(self):
+        """Обратное преобразование в формат PRINTERS_compatibility*.json
+
+        Порядок ID внутри списков сохраняется, принтеры упорядочены по ID.
+        """
+        return {
+            int_to_id(printer): {
+                "cartridges": self._row(self.cartridge_offsets, self.cartridge_targets, row),
+                "parts": self._row(self.part_offsets, self.part_targets, row),
+            }
+            for row, printer in enumerate(self.printer_ids)
+        }
+
+    def save_json(self, path):
+        write_json(path, self.to_json())
+
+class ProductRecord:
+    """Запись товара (создается по запросу из столбцов ProductTable)"""
+    __slots__ = ("id", "name", "availability", "in_transit", "wholesale_price", "retail_price",
+                 "characteristics", "description")
+
+    def __init__(self, product_id, name, availability, in_transit, wholesale_price, retail_price,
+                 characteristics, description):
+        self.id = product_id
+        self.name = name
+        self.availability = availability
+        self.in_transit = in_transit
+        self.wholesale_price = wholesale_price
+        self.retail_price = retail_price
+        self.characteristics = characteristics
+        self.description = description
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "availability": self.availability,
+            "in_transit": self.in_transit,
+            "wholesale_price": self.wholesale_price,
+            "retail_price": self.retail_price,
+            "characteristics": dict(self.characteristics),
+            "description": self.description,
+        }
+
+class ProductTable:
+    """Товары по столбцам (формат DATABASE_*.json)"""
+    __slots__ = ("ids", "names", "availability", "in_transit", "wholesale_prices", "retail_prices",
+                 "descriptions", "keys", "char_offsets", "char_keys", "char_values")
+    interned = ("keys", "char_values")
+
+    @classmethod
+    def from_json(cls, data):
+        self = cls()
+        ordered = sorted(data.items(), key=lambda item: id_to_int(item[0]))
+        self.ids = array('q', (id_to_int(product_id) for product_id, _ in ordered))
+        self.names = [record.get("name", "") for _, record in ordered]
+        self.availability = array('q', (record.get("availability", 0) for _, record in ordered))
+        self.in_transit = array('q', (record.get("in_transit", 0) for _, record in ordered))
+        self.wholesale_prices = array('d', (record.get("wholesale_price", 0.0) for _, record in ordered))
+        self.retail_prices = array('d', (record.get("retail_price", 0.0) for _, record in ordered))
+        self.descriptions = [record.get("description", "") for _, record in ordered]
+
+        key_index = {}
+        self.char_offsets = array('q', [0])
+        self.char_keys = array('H')
+        self.char_values = []
+        for _, record in ordered:
+            for key, value in record.get("characteristics", {}).items():
+                if key not in key_index:
+                    key_index[key] = len(key_index)
+                self.char_keys.append(key_index[key])
+                # Значения вроде "нет данных" или "совместимый" повторяются у сотен товаров
+                self.char_values.append(sys.intern(value))
+            self.char_offsets.append(len(self.char_keys))
+        self.keys = [sys.intern(key) for key in key_index]
+        return self
+
+    @classmethod
+    def load_json(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_json(json.load(f))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, product_id):
+        return find_index(self.ids, product_id) != -1
+
+    def _record(self, index):
+        start, end = self.char_offsets[index], self.char_offsets[index + 1]
+        characteristics = tuple(
+            (self.keys[self.char_keys[i]], self.char_values[i]) for i in range(start, end)
+        )
+        return ProductRecord(
+            int_to_id(self.ids[index]), self.names[index], self.availability[index], self.in_transit[index],
+            self.wholesale_prices[index], self.retail_prices[index], characteristics, self.descriptions[index]
+        )
+
+    def get(self, product_id):
+        index = find_index(self.ids, product_id)
+        return self._record(index) if index != -1 else None
+
+    def summary(self, product_id):
+        """Наименование, наличие и цены товара без характеристик и описания (для списков) или None"""
+        index = find_index(self.ids, product_id)
+        if index == -1:
+            return None
+        return {
+            "name": self.names[index],
+            "availability": self.availability[index],
+            "in_transit": self.in_transit[index],
+            "wholesale_price": self.wholesale_prices[index],
+            "retail_price": self.retail_prices[index],
+        }
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield self._record(index)
+
+    def to_json(self):
+        """Обратное преобразование в формат DATABASE_*.json (товары упорядочены по ID)"""
+        return {record.id: record.to_json() for record in self}
+
+    def save_json(self, path):
+        write_json(path, self.to_json())
+
+CACHE_TYPES = {cls.__name__: cls for cls in (CompactCompatibility, ProductTable)}
+
+def source_stamp(json_path):
+    """Отметка исходного JSON, для которого построен кэш"""
+    stat = os.stat(json_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def save_cache(obj, path, source=None):
+    """Бинарный кэш компактной структуры (атомарная запись)
+
+    source - отметка исходного JSON (source_stamp), с которой кэш сверяется при чтении.
+    """
+    fields = []
+    sections = []
+    for slot in obj.__slots__:
+        value = getattr(obj, slot)
+        if isinstance(value, array):
+            data = value.tobytes()
+            fields.append({"name": slot, "typecode": value.typecode, "itemsize": value.itemsize, "size": len(data)})
+        else:
+            data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+            fields.append({"name": slot, "size": len(data)})
+        sections.append(data)
+    header = {
+        "version": CACHE_VERSION, "type": type(obj).__name__, "byteorder": sys.byteorder,
+        "source": source, "fields": fields,
+    }
+    write_file(path, b"".join([CACHE_MAGIC, json.dumps(header).encode('utf-8'), b"\n"] + sections))
+
+def load_cache(path, source=None):
+    """Чтение кэша; ValueError, если он поврежден, другого формата или построен не для source"""
+    with open(path, 'rb') as f:
+        if f.readline() != CACHE_MAGIC:
+            raise ValueError(f"Неподдерживаемый кэш {path}")
+        header = json.loads(f.readline())
+        cls = CACHE_TYPES.get(header.get("type"))
+        if header.get("version") != CACHE_VERSION or cls is None or header.get("byteorder") != sys.byteorder:
+            raise ValueError(f"Неподдерживаемый кэш {path}")
+        if source is not None and header.get("source") != source:
+            raise ValueError(f"Кэш {path} построен для другой версии файла")
+        obj = cls()
+        for field in header["fields"]:
+            if field["name"] not in cls.__slots__:
+                raise ValueError(f"Неизвестное поле {field['name']!r} в кэше {path}")
+            data = f.read(field["size"])
+            if len(data) != field["size"]:
+                raise ValueError(f"Кэш {path} обрезан")
+            if "typecode" in field:
+                if field["typecode"] not in CACHE_TYPECODES:
+                    raise ValueError(f"Неподдерживаемый тип массива в кэше {path}")
+                value = array(field["typecode"])
+                if value.itemsize != field["itemsize"]:
+                    raise ValueError(f"Кэш {path} создан на другой платформе")
+                value.frombytes(data)
+            else:
+                value = json.loads(data)
+            setattr(obj, field["name"], value)
+    if {field["name"] for field in header["fields"]} != set(cls.__slots__):
+        raise ValueError(f"Неполный кэш {path}")
+    for slot in cls.interned:
+        setattr(obj, slot, [sys.intern(value) for value in getattr(obj, slot)])
+    return obj
+
+def load_cached(cls, json_path, cache_path=None):
+    """Загрузка из кэша, если он построен для текущей версии JSON, иначе из JSON с обновлением кэша
+
+    Кэш сверяется с временем изменения и размером JSON, записанными при его создании.
+    """
+    cache_path = cache_path or json_path + ".cache"
+    # Отметка берется до чтения: если JSON заменят во время загрузки, кэш не совпадет с новым файлом
+    source = source_stamp(json_path)
+    if os.path.exists(cache_path):
+        try:
+            obj = load_cache(cache_path, source)
+            if isinstance(obj, cls):
+                return obj
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    obj = cls.load_json(json_path)
+    try:
+        save_cache(obj, cache_path, source)
+    except OSError:
+        # Кэш необязателен (например, папка только для чтения)
+        pass
+    return obj
@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+
+from comcenter_jsonio import write_json
+from comcenter_parser import (
+    CancelFlag, setup_session, perform_action, run_interruptible, output_dir,
+)
+
+# Фоновый режим: одна авторизованная сессия (с пулом соединений) живет все время работы,
+# действия выполняются по расписанию. Прайс-лист и цены обновляются часто, совместимость
+# и полные карточки товаров - реже. Файлы публикуются атомарно (comcenter_jsonio), поэтому
+# GUI, сервис запросов и другие читатели могут работать с базами одновременно с демоном.
+# Время последнего выполнения задач сохраняется, перезапуск не повторяет свежие задачи
+
+# Задачи: имя -> действия парсера (при одновременном наступлении срока - в этом порядке)
+TASKS = {
+    "prices": ("2", "8"),
+    "compatibility": ("1", "3", "4", "6"),
+    "details": ("5", "7"),
+}
+# Интервалы запуска задач в секундах
+default_intervals = {
+    "prices": 15 * 60,
+    "compatibility": 24 * 60 * 60,
+    "details": 6 * 60 * 60,
+}
+# Повторная авторизация, чтобы не работать с истекшей сессией сайта
+relogin_interval = 6 * 60 * 60
+# Пауза перед повторной попыткой после неудачной авторизации или задачи
+retry_interval = 5 * 60
+daemon_state_file = os.path.join(output_dir, "daemon_state.json")
+# Лог фонового режима с ротацией (comcenter_parser.log для ручных запусков не растет)
+daemon_log_file = os.path.join(output_dir, "daemon.log")
+daemon_log_max_bytes = 5 * 1024 * 1024
+daemon_log_backups = 3
+
+class DaemonOutputHandler:
+    """Вывод фонового режима: консоль и ротируемый лог, строки прогресса не выводятся"""
+    def __init__(self, path=daemon_log_file, max_bytes=daemon_log_max_bytes, backups=daemon_log_backups):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S"))
+        self.logger = logging.getLogger("comcenter_daemon")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(handler)
+
+    def log(self, message):
+        print(message)
+        self.logger.info(message)
+
+    def progress(self, current, total):
+        pass
+
+class Daemon:
+    """Выполнение задач по расписанию в одной сессии"""
+    def __init__(self, output_handler, cancel_flag, intervals=None, state_file=daemon_state_file):
+        self.output_handler = output_handler
+        self.cancel_flag = cancel_flag
+        self.intervals = {**default_intervals, **(intervals or {})}
+        self.state_file = state_file
+        self.state = self.load_state()
+        self.session_info = None
+        self.logged_in_at = 0.0
+
+    def load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.output_handler.log(f"Ошибка при чтении файла {self.state_file}: {e}")
+            return {}
+
+    def next_run(self, task):
+        return self.state.get(task, {}).get("last_run", 0) + self.intervals[task]
+
+    def due_tasks(self, now):
+        return [task for task in TASKS if self.intervals[task] > 0 and self.next_run(task) <= now]
+
+    def ensure_session(self):
+        """Авторизованная сессия; повторный вход при первом запуске и по истечении relogin_interval"""
+        if self.session_info and time.time() - self.logged_in_at < relogin_interval:
+            return self.session_info
+        if self.session_info:
+            self.session_info[0].close()
+        self.session_info = setup_session(self.output_handler)
+        self.logged_in_at = time.time()
+        return self.session_info
+
+    def run_task(self, task):
+        """Выполнение задачи; время запуска сохраняется, только если все действия выполнены"""
+        session, headers = self.session_info
+        started = time.time()
+        self.output_handler.log(f"Задача '{task}': действия {', '.join(TASKS[task])}")
+        try:
+            for choice in TASKS[task]:
+                if self.cancel_flag.is_cancelled():
+                    return False
+                if not perform_action(choice, session, headers, self.output_handler, self.cancel_flag):
+                    if not self.cancel_flag.is_cancelled():
+                        self.output_handler.log(f"Действие {choice} задачи '{task}' не выполнено")
+                        # Ошибка могла быть вызвана истекшей сессией - при повторе выполняется вход
+                        self.session_info = None
+                    return False
+        except Exception as e:
+            # Сессия могла стать неработоспособной - при следующей задаче выполняется повторный вход
+            self.output_handler.log(f"Ошибка при выполнении задачи '{task}': {e}")
+            self.session_info = None
+            return False
+        if self.cancel_flag.is_cancelled():
+            return False
+        self.state[task] = {"last_run": started, "duration": round(time.time() - started, 1)}
+        write_json(self.state_file, self.state)
+        self.output_handler.log(f"Задача '{task}' выполнена за {self.state[task]['duration']:.0f} с")
+        return True
+
+    def run(self, once=False):
+        """Основной цикл; once - выполнить задачи, срок которых наступил, и выйти"""
+        while not self.cancel_flag.is_cancelled():
+            now = time.time()
+            due = self.due_tasks(now)
+            if not due:
+                if once:
+                    break
+                pending = [self.next_run(task) for task in TASKS if self.intervals[task] > 0]
+                if not pending:
+                    self.output_handler.log("Нет задач с ненулевым интервалом")
+                    break
+                wake_at = min(pending)
+                self.output_handler.log(f"Следующая задача в {time.strftime('%H:%M:%S', time.localtime(wake_at))}")
+                self.cancel_flag.event.wait(max(wake_at - now, 0))
+                continue
+            if not self.ensure_session():
+                self.output_handler.log(f"Не удалось авторизоваться, повтор через {retry_interval // 60} мин")
+                if once:
+                    break
+                self.cancel_flag.event.wait(retry_interval)
+                continue
+            if not self.run_task(due[0]) and not self.cancel_flag.is_cancelled():
+                self.output_handler.log(f"Задача '{due[0]}' будет повторена через {retry_interval // 60} мин")
+                if once:
+                    break
+                self.cancel_flag.event.wait(retry_interval)
+        self.output_handler.log("Фоновый режим остановлен")
+
+def daemon_main():
+    """Запуск фонового режима из консоли"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Обновление баз Comcenter по расписанию")
+    for task, interval in default_intervals.items():
+        parser.add_argument(f"--{task}-interval", type=float, default=interval / 60,
+                            help=f"интервал задачи '{task}' ({', '.join(TASKS[task])}), мин; 0 - отключить")
+    parser.add_argument("--once", action="store_true", help="выполнить задачи, срок которых наступил, и выйти")
+    args = parser.parse_args()
+
+    intervals = {task: getattr(args, f"{task}_interval") * 60 for task in TASKS}
+    output_handler = DaemonOutputHandler()
+    cancel_flag = CancelFlag()
+    daemon = Daemon(output_handler, cancel_flag, intervals)
+    run_interruptible(daemon.run, (args.once,), output_handler, cancel_flag, "Запрос на остановку отправлен...")
+
+if __name__ == "__main__":
+    daemon_main()
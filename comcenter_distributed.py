@@ -0,0 +1,541 @@
+import hmac
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from comcenter_parser import (
+    ConsoleOutputHandler, CancelFlag, OperationCancelled, setup_session, fetch_product,
+    ensure_xls_file, collect_compatible_ids, load_recent_ids, save_parsed_products,
+    load_stock_data, order_crawl_queue, fetch_times_file, fingerprints_file,
+    merge_with_existing, compatibility_output_file, compatibility_actual_output_file,
+    all_cartridges_parts_output_file, cartridges_parts_output_file, comcenter_products_output_file,
+    metrics_dir, work_queue_file,
+)
+from comcenter_fingerprints import FingerprintStore
+from comcenter_metrics import RunMetrics
+from comcenter_priority import record_fetch_times
+
+# Распределенный парсинг товаров: координатор делит ID на порции (shards) в очереди SQLite,
+# рабочие берут порции в аренду, парсят товары и записывают результаты обратно. Порции, аренда
+# которых истекла (рабочий упал или завис), выдаются повторно. Слияние собирает результаты
+# в обычные базы DATABASE_*.json.
+# Очередь работает в режиме WAL, которому нужна общая память процессов, поэтому файл очереди
+# открывают только процессы машины координатора. Рабочие на других машинах (со своим IP)
+# обращаются к очереди через HTTP-сервер координатора (команда coordinator, рабочие с --coordinator)
+
+# Задания: имя -> итоговый файл (ID берутся из совместимости или DATABASE_recent.json)
+JOBS = {
+    "all": all_cartridges_parts_output_file,
+    "actual": cartridges_parts_output_file,
+    "products": comcenter_products_output_file,
+}
+
+shard_size = 50
+lease_seconds = 300
+max_attempts = 3
+# Пауза рабочего, когда свободных порций нет, но чужие еще в работе
+idle_poll_seconds = 5
+# HTTP-сервер координатора для рабочих на других машинах
+coordinator_host = "0.0.0.0"
+coordinator_port = 8766
+coordinator_timeout = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    output_file TEXT,
+    created_at REAL,
+    total INTEGER
+);
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    job TEXT,
+    product_ids TEXT,
+    status TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER DEFAULT 0,
+    failed_ids TEXT
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (job, status);
+CREATE TABLE IF NOT EXISTS results (
+    job TEXT,
+    product_id TEXT,
+    record TEXT,
+    PRIMARY KEY (job, product_id)
+);
+CREATE TABLE IF NOT EXISTS stock (
+    job TEXT PRIMARY KEY,
+    data TEXT
+);
+"""
+
+def connect(queue_path, check_same_thread=True):
+    """Подключение к очереди; WAL позволяет читать, пока другой процесс пишет (только локальный диск)"""
+    os.makedirs(os.path.dirname(queue_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(queue_path, timeout=30, isolation_level=None, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def job_product_ids(job, output_handler):
+    """ID товаров для задания"""
+    if job == "all":
+        return collect_compatible_ids(compatibility_output_file, output_handler)
+    if job == "actual":
+        return collect_compatible_ids(compatibility_actual_output_file, output_handler)
+    return load_recent_ids(output_handler)
+
+def create_job(queue_path, job, product_ids, output_file, output_handler, stock_data, size=shard_size):
+    """Координатор: постановка задания в очередь (предыдущее задание с тем же именем удаляется)
+
+    Порции выдаются рабочим по порядку, поэтому ID упорядочиваются по приоритету.
+    Остатки из прайс-листа (stock_data - {ID: (наличие, в пути)}) сохраняются в очереди:
+    рабочие берут "В пути" оттуда и сами прайс-лист не скачивают.
+    """
+    product_ids = order_crawl_queue(product_ids, stock_data, output_handler)
+    job_stock = {product_id: stock_data[product_id] for product_id in product_ids if product_id in stock_data}
+    conn = connect(queue_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM shards WHERE job = ?", (job,))
+        conn.execute("DELETE FROM results WHERE job = ?", (job,))
+        conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)", (job, output_file, time.time(), len(product_ids)))
+        conn.execute("INSERT OR REPLACE INTO stock VALUES (?, ?)", (job, json.dumps(job_stock)))
+        conn.executemany(
+            "INSERT INTO shards (job, product_ids, status) VALUES (?, ?, 'pending')",
+            [(job, json.dumps(product_ids[i:i + size])) for i in range(0, len(product_ids), size)]
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    shards = (len(product_ids) + size - 1) // size
+    output_handler.log(f"Задание '{job}': {len(product_ids)} товаров в {shards} порциях поставлено в очередь {queue_path}")
+
+def load_job_in_transit(conn, job):
+    """Данные о товарах в пути, сохраненные координатором для задания"""
+    row = conn.execute("SELECT data FROM stock WHERE job = ?", (job,)).fetchone()
+    if not row:
+        return {}
+    return {product_id: in_transit for product_id, (_, in_transit) in json.loads(row[0]).items()}
+
+def lease_shard(conn, worker_id, lease=lease_seconds):
+    """Аренда свободной порции или порции с истекшей арендой"""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, job, product_ids FROM shards "
+            "WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) AND attempts < ? "
+            "ORDER BY id LIMIT 1",
+            (now, max_attempts)
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE shards SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + lease, row[0])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if not row:
+        return None
+    return row[0], row[1], json.loads(row[2])
+
+def renew_lease(conn, shard_id, worker_id, lease=lease_seconds):
+    """Продление аренды; False, если порция уже передана другому рабочему"""
+    cursor = conn.execute(
+        "UPDATE shards SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+        (time.time() + lease, shard_id, worker_id)
+    )
+    return cursor.rowcount == 1
+
+def release_shard(conn, shard_id, worker_id):
+    """Возврат порции в очередь без учета попытки (при отмене)"""
+    conn.execute(
+        "UPDATE shards SET status = 'pending', worker = NULL, attempts = attempts - 1 "
+        "WHERE id = ? AND worker = ? AND status = 'leased'",
+        (shard_id, worker_id)
+    )
+
+def complete_shard(conn, shard_id, worker_id, job, records, failed_ids):
+    """Запись результатов порции и отметка о выполнении"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        owned = conn.execute(
+            "SELECT 1 FROM shards WHERE id = ? AND worker = ? AND status = 'leased'", (shard_id, worker_id)
+        ).fetchone()
+        if owned:
+            conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                [(job, product_id, json.dumps(record, ensure_ascii=False)) for product_id, record in records.items()]
+            )
+            conn.execute(
+                "UPDATE shards SET status = 'done', failed_ids = ? WHERE id = ?",
+                (json.dumps(failed_ids), shard_id)
+            )
+        conn.execute("COMMIT")
+        return bool(owned)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def has_unfinished_shards(conn):
+    """Есть ли порции, которые еще могут быть выполнены"""
+    row = conn.execute(
+        "SELECT COUNT(*) FROM shards WHERE status != 'done' AND attempts < ?", (max_attempts,)
+    ).fetchone()
+    return row[0] > 0
+
+def requeue_failed(conn, job, size=shard_size):
+    """Постановка в очередь товаров, которые не удалось обработать в выполненных порциях
+
+    Возвращает число товаров; у исходных порций список ошибок очищается.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = {product_id for (product_id,) in conn.execute("SELECT product_id FROM results WHERE job = ?", (job,))}
+        failed_ids = []
+        for (failed,) in conn.execute("SELECT failed_ids FROM shards WHERE job = ? AND status = 'done'", (job,)):
+            failed_ids.extend(product_id for product_id in json.loads(failed or "[]") if product_id not in done)
+        failed_ids = list(dict.fromkeys(failed_ids))
+        conn.execute("UPDATE shards SET failed_ids = NULL WHERE job = ? AND status = 'done'", (job,))
+        conn.executemany(
+            "INSERT INTO shards (job, product_ids, status) VALUES (?, ?, 'pending')",
+            [(job, json.dumps(failed_ids[i:i + size])) for i in range(0, len(failed_ids), size)]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(failed_ids)
+
+class LocalQueue:
+    """Очередь в файле SQLite (процессы машины координатора)"""
+    def __init__(self, queue_path, check_same_thread=True):
+        self.conn = connect(queue_path, check_same_thread)
+
+    def lease(self, worker_id, lease=lease_seconds):
+        return lease_shard(self.conn, worker_id, lease)
+
+    def renew(self, shard_id, worker_id, lease=lease_seconds):
+        return renew_lease(self.conn, shard_id, worker_id, lease)
+
+    def release(self, shard_id, worker_id):
+        release_shard(self.conn, shard_id, worker_id)
+
+    def complete(self, shard_id, worker_id, job, records, failed_ids):
+        return complete_shard(self.conn, shard_id, worker_id, job, records, failed_ids)
+
+    def has_unfinished(self):
+        return has_unfinished_shards(self.conn)
+
+    def job_in_transit(self, job):
+        return load_job_in_transit(self.conn, job)
+
+    def close(self):
+        self.conn.close()
+
+# Операции очереди, доступные рабочим через HTTP-сервер координатора
+REMOTE_METHODS = ("lease", "renew", "release", "complete", "has_unfinished", "job_in_transit")
+
+class RemoteQueue:
+    """Очередь на другой машине: те же операции, что у LocalQueue, через HTTP-сервер координатора"""
+    def __init__(self, url, token=None):
+        self.url = url.rstrip("/")
+        self.http = requests.Session()
+        if token:
+            self.http.headers["Authorization"] = f"Bearer {token}"
+
+    def call(self, method, **kwargs):
+        response = self.http.post(f"{self.url}/{method}", json=kwargs, timeout=coordinator_timeout)
+        response.raise_for_status()
+        return response.json()["result"]
+
+    def lease(self, worker_id, lease=lease_seconds):
+        shard = self.call("lease", worker_id=worker_id, lease=lease)
+        return tuple(shard) if shard else None
+
+    def renew(self, shard_id, worker_id, lease=lease_seconds):
+        return self.call("renew", shard_id=shard_id, worker_id=worker_id, lease=lease)
+
+    def release(self, shard_id, worker_id):
+        self.call("release", shard_id=shard_id, worker_id=worker_id)
+
+    def complete(self, shard_id, worker_id, job, records, failed_ids):
+        return self.call("complete", shard_id=shard_id, worker_id=worker_id, job=job, records=records, failed_ids=failed_ids)
+
+    def has_unfinished(self):
+        return self.call("has_unfinished")
+
+    def job_in_transit(self, job):
+        return self.call("job_in_transit", job=job)
+
+    def close(self):
+        self.http.close()
+
+def open_queue(queue_path, coordinator=None, token=None):
+    """Очередь рабочего: файл SQLite или HTTP-сервер координатора"""
+    if coordinator:
+        return RemoteQueue(coordinator, token)
+    return LocalQueue(queue_path)
+
+def make_coordinator(queue_path, host=coordinator_host, port=coordinator_port, token=None):
+    """HTTP-сервер координатора: выдает порции и принимает результаты рабочих с других машин
+
+    Запрос - POST /<операция> с аргументами в JSON, ответ - {"result": ...}. Соединение
+    с очередью одно на сервер, операции выполняются по очереди. Если задан token, рабочие
+    должны передавать его в заголовке Authorization: Bearer <token>.
+    """
+    queue = LocalQueue(queue_path, check_same_thread=False)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+                self.send_json(403, {"error": "неверный токен"})
+                return
+            method = self.path.strip("/")
+            if method not in REMOTE_METHODS:
+                self.send_json(404, {"error": f"неизвестная операция '{method}'"})
+                return
+            try:
+                kwargs = json.loads(body or b"{}")
+                with lock:
+                    result = getattr(queue, method)(**kwargs)
+            except (ValueError, TypeError) as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            self.send_json(200, {"result": result})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.queue = queue
+    return server
+
+def run_worker(queue, session, headers, output_handler, cancel_flag, worker_id=None, lease=lease_seconds):
+    """Рабочий: выполнение порций из очереди (LocalQueue или RemoteQueue), пока они не закончатся"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    metrics = RunMetrics(f"worker_{worker_id.replace(':', '_')}")
+    # "В пути" по заданиям (из очереди, прайс-лист рабочие не скачивают)
+    in_transit_by_job = {}
+    # Отпечатки страниц хранятся локально у каждого рабочего
+    fingerprints = FingerprintStore(fingerprints_file)
+    shards_done = 0
+    try:
+        while not cancel_flag.is_cancelled():
+            shard = queue.lease(worker_id, lease)
+            if not shard:
+                if not queue.has_unfinished():
+                    break
+                # Остальные порции в работе у других рабочих - ждем, не истечет ли их аренда
+                cancel_flag.event.wait(idle_poll_seconds)
+                continue
+
+            shard_id, job, product_ids = shard
+            if job not in in_transit_by_job:
+                in_transit_by_job[job] = queue.job_in_transit(job)
+            in_transit_data = in_transit_by_job[job]
+            output_handler.log(f"[{worker_id}] Порция {shard_id} задания '{job}': {len(product_ids)} товаров")
+            records = {}
+            failed_ids = []
+            lost_lease = False
+            for product_id in product_ids:
+                if cancel_flag.is_cancelled():
+                    break
+                try:
+                    records[product_id] = cancel_flag.call(
+                        fetch_product, session, headers, product_id, in_transit_data, output_handler, metrics, fingerprints
+                    )
+                    metrics.item_done()
+                except OperationCancelled:
+                    break
+                except requests.exceptions.RequestException as e:
+                    metrics.item_done(ok=False)
+                    failed_ids.append(product_id)
+                    output_handler.log(f"Ошибка при загрузке страницы для ID {product_id}: {e}")
+                except Exception as e:
+                    metrics.item_done(ok=False)
+                    failed_ids.append(product_id)
+                    output_handler.log(f"Ошибка при парсинге данных для ID {product_id}: {e}")
+                if not queue.renew(shard_id, worker_id, lease):
+                    lost_lease = True
+                    break
+
+            if lost_lease:
+                output_handler.log(f"[{worker_id}] Аренда порции {shard_id} истекла, результаты отброшены")
+            elif cancel_flag.is_cancelled():
+                queue.release(shard_id, worker_id)
+                output_handler.log(f"[{worker_id}] Операция отменена, порция {shard_id} возвращена в очередь")
+            elif queue.complete(shard_id, worker_id, job, records, failed_ids):
+                shards_done += 1
+    finally:
+        queue.close()
+        fingerprints.report(output_handler)
+        fingerprints.close()
+    output_handler.log(f"[{worker_id}] Рабочий завершен, выполнено порций: {shards_done}")
+    metrics.finish(output_handler, metrics_dir)
+    return shards_done
+
+def job_status(queue_path, job):
+    """Состояние задания: число порций по статусам и число полученных товаров"""
+    conn = connect(queue_path)
+    try:
+        now = time.time()
+        status = {"pending": 0, "leased": 0, "expired": 0, "failed": 0, "done": 0}
+        for state, expires, attempts in conn.execute(
+            "SELECT status, lease_expires, attempts FROM shards WHERE job = ?", (job,)
+        ):
+            if state == "leased" and expires < now:
+                state = "failed" if attempts >= max_attempts else "expired"
+            status[state] += 1
+        status["results"] = conn.execute("SELECT COUNT(*) FROM results WHERE job = ?", (job,)).fetchone()[0]
+        return status
+    finally:
+        conn.close()
+
+def merge_job(queue_path, job, output_handler):
+    """Слияние результатов задания в итоговую базу
+
+    Если задание выполнено не полностью или часть товаров не удалось обработать,
+    недостающие товары берутся из существующего файла.
+    """
+    conn = connect(queue_path)
+    try:
+        row = conn.execute("SELECT output_file FROM jobs WHERE name = ?", (job,)).fetchone()
+        if not row:
+            output_handler.log(f"Задание '{job}' не найдено в очереди")
+            return
+        output_file = row[0]
+        parsed_data = {
+            product_id: json.loads(record)
+            for product_id, record in conn.execute("SELECT product_id, record FROM results WHERE job = ?", (job,))
+        }
+        fetched = list(parsed_data)
+        failed = set()
+        for (failed_ids,) in conn.execute("SELECT failed_ids FROM shards WHERE job = ?", (job,)):
+            failed.update(product_id for product_id in json.loads(failed_ids or "[]") if product_id not in parsed_data)
+    finally:
+        conn.close()
+
+    status = job_status(queue_path, job)
+    incomplete = status["pending"] + status["leased"] + status["expired"] + status["failed"]
+    if incomplete:
+        output_handler.log(f"Задание '{job}' выполнено не полностью ({incomplete} порций), недостающие данные берутся из '{output_file}'")
+    if failed:
+        output_handler.log(
+            f"Не удалось обработать товаров: {len(failed)}, их данные берутся из '{output_file}' "
+            f"(повторить: команда retry {job})"
+        )
+    if incomplete or failed:
+        parsed_data = merge_with_existing(parsed_data, output_file, output_handler)
+    record_fetch_times(fetched, fetch_times_file)
+    save_parsed_products(parsed_data, output_file, output_handler, RunMetrics(f"merge_{job}"), fetched)
+
+def worker_process(queue_path, lease=lease_seconds, coordinator=None, token=None):
+    """Точка входа отдельного рабочего процесса"""
+    output_handler = ConsoleOutputHandler()
+    session_info = setup_session(output_handler)
+    if not session_info:
+        output_handler.log("Не удалось авторизоваться. Рабочий завершен.")
+        return
+    session, headers = session_info
+    run_worker(open_queue(queue_path, coordinator, token), session, headers, output_handler, CancelFlag(), lease=lease)
+
+def distributed_main():
+    """Консольный интерфейс распределенного парсинга"""
+    import argparse
+    import multiprocessing
+    parser = argparse.ArgumentParser(description="Распределенный парсинг товаров Comcenter")
+    parser.add_argument("--queue", default=work_queue_file, help="файл очереди SQLite на локальном диске координатора")
+    sub = parser.add_subparsers(dest="command", required=True)
+    create = sub.add_parser("create", help="поставить задание в очередь")
+    create.add_argument("job", choices=sorted(JOBS))
+    create.add_argument("--shard-size", type=int, default=shard_size)
+    worker = sub.add_parser("worker", help="запустить рабочих")
+    worker.add_argument("--processes", type=int, default=1, help="число рабочих процессов на этой машине")
+    worker.add_argument("--lease", type=int, default=lease_seconds, help="срок аренды порции, с")
+    worker.add_argument("--coordinator", help="адрес координатора на другой машине (http://host:8766) вместо файла очереди")
+    worker.add_argument("--token", help="токен доступа к координатору")
+    coordinator = sub.add_parser("coordinator", help="HTTP-сервер очереди для рабочих на других машинах")
+    coordinator.add_argument("--host", default=coordinator_host)
+    coordinator.add_argument("--port", type=int, default=coordinator_port)
+    coordinator.add_argument("--token", help="токен, который должны передавать рабочие")
+    status = sub.add_parser("status", help="состояние задания")
+    status.add_argument("job", choices=sorted(JOBS))
+    retry = sub.add_parser("retry", help="поставить в очередь товары, которые не удалось обработать")
+    retry.add_argument("job", choices=sorted(JOBS))
+    retry.add_argument("--shard-size", type=int, default=shard_size)
+    merge = sub.add_parser("merge", help="собрать результаты в итоговую базу")
+    merge.add_argument("job", choices=sorted(JOBS))
+    args = parser.parse_args()
+
+    output_handler = ConsoleOutputHandler()
+    if args.command == "create":
+        product_ids = job_product_ids(args.job, output_handler)
+        if not product_ids:
+            return
+        # Координатор один раз проверяет свежесть прайс-листа и передает остатки рабочим через очередь
+        session_info = setup_session(output_handler)
+        if not session_info:
+            output_handler.log("Не удалось авторизоваться. Задание не создано.")
+            return
+        session, headers = session_info
+        if not ensure_xls_file(session, headers, output_handler, CancelFlag()):
+            output_handler.log("Не удалось получить temp_price.xls. Задание не создано.")
+            return
+        create_job(args.queue, args.job, product_ids, JOBS[args.job], output_handler, load_stock_data(output_handler), args.shard_size)
+    elif args.command == "worker":
+        processes = [
+            multiprocessing.Process(target=worker_process, args=(args.queue, args.lease, args.coordinator, args.token))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    elif args.command == "coordinator":
+        server = make_coordinator(args.queue, args.host, args.port, args.token)
+        output_handler.log(f"Координатор запущен: http://{args.host}:{server.server_address[1]}, очередь {args.queue}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            output_handler.log("Координатор остановлен")
+        finally:
+            server.queue.close()
+    elif args.command == "status":
+        print(json.dumps(job_status(args.queue, args.job), ensure_ascii=False, indent=2))
+    elif args.command == "retry":
+        conn = connect(args.queue)
+        try:
+            count = requeue_failed(conn, args.job, args.shard_size)
+        finally:
+            conn.close()
+        output_handler.log(f"Задание '{args.job}': в очередь повторно поставлено товаров: {count}")
+    else:
+        merge_job(args.queue, args.job, output_handler)
+
+if __name__ == "__main__":
+    distributed_main()
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Хранилище отпечатков страниц: для каждого URL - хеш нормализованного тела страницы
+# и извлеченная из нее запись. Если при следующем запуске страница не изменилась,
+# запись берется из хранилища без разбора BeautifulSoup.
+# Нормализация убирает то, что меняется от запроса к запросу, но не влияет на извлечение:
+# токены защиты форм и пробелы в начале/конце строк
+
+# Меняется при изменении логики извлечения, чтобы старые записи не использовались
+extractor_version = 1
+
+volatile_patterns = [
+    # Токен ASP.NET MVC в скрытых полях форм и meta-тегах
+    re.compile(rb'(__RequestVerificationToken"[^>]*?(?:value|content)=")[^"]*(")'),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    record TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+def normalize_body(body):
+    for pattern in volatile_patterns:
+        body = pattern.sub(rb'\1\2', body)
+    return b"\n".join(line.strip() for line in body.splitlines() if line.strip())
+
+def page_digest(body, kind):
+    """Отпечаток страницы; kind различает способы извлечения (товар, совместимость)"""
+    digest = hashlib.sha256(f"{kind}:{extractor_version}\n".encode('utf-8'))
+    digest.update(normalize_body(body))
+    return digest.hexdigest()
+
+class FingerprintStore:
+    """Отпечатки страниц в SQLite (безопасно для нескольких потоков и процессов)"""
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, url, digest):
+        """Ранее извлеченная запись, если отпечаток страницы не изменился, иначе None"""
+        with self.lock:
+            row = self.conn.execute("SELECT digest, record FROM pages WHERE url = ?", (url,)).fetchone()
+            if row and row[0] == digest:
+                self.hits += 1
+                return json.loads(row[1])
+            self.misses += 1
+            return None
+
+    def store(self, url, digest, record):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                (url, digest, json.dumps(record, ensure_ascii=False), time.time())
+            )
+            self.conn.commit()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self, output_handler):
+        total = self.hits + self.misses
+        if total:
+            output_handler.log(
+                f"Отпечатки страниц: без изменений {self.hits} из {total} ({self.hit_rate():.0%}), "
+                f"разобрано заново {self.misses}"
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
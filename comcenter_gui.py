@@ -1,12 +1,13 @@
 import tkinter as tk
 from tkinter import scrolledtext, ttk
 import threading
-from comcenter_parser import (setup_session, get_laser_printers_database, process_xls_database,
-                             parse_printer_compatibility, filter_compatibility_by_stock,
-                             parse_cartridges_and_parts, parse_all_cartridges_and_parts,
-                             parse_comcenter_products, run_action, CancelFlag)
+import os
+import time
 import datetime
 
+# comcenter_parser (requests, xlrd, BeautifulSoup) импортируется в фоновом потоке
+# после появления окна, чтобы окно открывалось сразу
+
 class Tooltip:
     """Класс для создания всплывающих подсказок"""
     def __init__(self, widget, text):
@@ -82,6 +83,7 @@ class ComcenterGUI:
             ("ПАРСИНГ КАРТРИДЖЕЙ И ЗАПЧАСТЕЙ В НАЛИЧИИ", self.run_action_5, "Парсит данные актуальных картриджей и запчастей"),
             ("ПОЛНЫЙ ПАРСИНГ КАРТРИДЖЕЙ И ЗАПЧАСТЕЙ", self.run_action_6, "Парсит данные всех картриджей и запчастей"),
             ("ПАРСИНГ ПРАЙСА ТОВАРОВ", self.run_action_7, "Парсит данные всех актуальных товаров Comcenter"),
+            ("ОБНОВЛЕНИЕ ЦЕН И НАЛИЧИЯ", self.run_action_8, "Быстро обновляет только цены и наличие в базе товаров Comcenter"),
             ("Выход", self.exit, "")
         ]
 
@@ -102,17 +104,31 @@ class ComcenterGUI:
         # Флаг отмены
         self.cancel_flag = None
 
-        # Инициализация сессии и запуск начальных действий
+        # Инициализация сессии и запуск начальных действий в фоне, без блокировки окна
+        self.parser = None
         self.session_info = None
-        self.setup_session()
-        if self.session_info:
-            self.run_initial_actions()
+        self.enable_buttons(False)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.output_handler.log("Подключение к comcenter.ru...")
+        threading.Thread(target=self.setup_session, daemon=True).start()
 
     def setup_session(self):
-        """Инициализация сессии"""
-        self.session_info = setup_session(self.output_handler)
+        """Импорт парсера и инициализация сессии (выполняется в фоновом потоке)"""
+        try:
+            import comcenter_parser
+            self.parser = comcenter_parser
+            self.session_info = comcenter_parser.setup_session(self.output_handler)
+        except Exception as e:
+            self.output_handler.log(f"Ошибка при инициализации: {e}")
+        self.root.after(0, self.on_session_ready)
+
+    def on_session_ready(self):
+        """Продолжение запуска в потоке интерфейса после инициализации сессии"""
         if not self.session_info:
             self.output_handler.log("Не удалось авторизоваться. Некоторые функции будут недоступны.")
+            self.enable_buttons(True)
+            return
+        self.run_initial_actions()
 
     def enable_buttons(self, enable=True):
         """Активация/деактивация кнопок меню"""
@@ -127,7 +143,7 @@ class ComcenterGUI:
 
     def run_in_thread(self, action):
         """Запуск действия в отдельном потоке"""
-        self.cancel_flag = CancelFlag()
+        self.cancel_flag = self.parser.CancelFlag()
         self.enable_buttons(False)
         self.reset_progress()
 
@@ -157,13 +173,21 @@ class ComcenterGUI:
         self.run_in_thread(lambda: self.initial_actions_wrapper(session, headers))
 
     def initial_actions_wrapper(self, session, headers):
-        """Обертка для последовательного выполнения действий 1 и 2"""
+        """Обертка для последовательного выполнения действий 1 и 2
+
+        Действие 1 пропускается, если список принтеров свежий (например, его обновляет comcenter_daemon.py);
+        действие 2 выполняется всегда - прайс-лист скачивается условно и разбирается только при изменении.
+        """
         try:
-            get_laser_printers_database(session, headers, self.output_handler, CancelFlag())
-            if self.cancel_flag and self.cancel_flag.is_cancelled():
+            printers_file = self.parser.printers_output_file
+            if os.path.exists(printers_file) and time.time() - os.path.getmtime(printers_file) < self.parser.printers_max_age:
+                self.output_handler.log(f"Список принтеров '{printers_file}' актуален, обновление пропущено")
+            else:
+                self.parser.get_laser_printers_database(session, headers, self.output_handler, self.cancel_flag)
+            if self.cancel_flag.is_cancelled():
                 self.output_handler.log("Операция отменена")
                 return
-            process_xls_database(session, headers, self.output_handler, CancelFlag())
+            self.parser.process_xls_database(session, headers, self.output_handler, self.cancel_flag)
         except Exception as e:
             self.output_handler.log(f"Ошибка при выполнении начальных действий: {e}")
 
@@ -178,11 +202,11 @@ class ComcenterGUI:
     def action_3_4_wrapper(self, session, headers):
         """Обертка для последовательного выполнения действий 3 и 4"""
         try:
-            parse_printer_compatibility(session, headers, self.output_handler, CancelFlag())
-            if self.cancel_flag and self.cancel_flag.is_cancelled():
+            self.parser.parse_printer_compatibility(session, headers, self.output_handler, self.cancel_flag)
+            if self.cancel_flag.is_cancelled():
                 self.output_handler.log("Операция отменена")
                 return
-            filter_compatibility_by_stock(self.output_handler, CancelFlag())
+            self.parser.filter_compatibility_by_stock(self.output_handler, self.cancel_flag)
         except Exception as e:
             self.output_handler.log(f"Ошибка при парсинге совместимости: {e}")
 
@@ -192,7 +216,7 @@ class ComcenterGUI:
             self.output_handler.log("Сессия не инициализирована. Пожалуйста, перезапустите приложение.")
             return
         session, headers = self.session_info
-        self.run_in_thread(lambda: parse_cartridges_and_parts(session, headers, self.output_handler, self.cancel_flag))
+        self.run_in_thread(lambda: self.parser.parse_cartridges_and_parts(session, headers, self.output_handler, self.cancel_flag))
 
     def run_action_6(self):
         """Действие 6: Парсинг всех картриджей и запчастей"""
@@ -200,7 +224,7 @@ class ComcenterGUI:
             self.output_handler.log("Сессия не инициализирована. Пожалуйста, перезапустите приложение.")
             return
         session, headers = self.session_info
-        self.run_in_thread(lambda: parse_all_cartridges_and_parts(session, headers, self.output_handler, self.cancel_flag))
+        self.run_in_thread(lambda: self.parser.parse_all_cartridges_and_parts(session, headers, self.output_handler, self.cancel_flag))
 
     def run_action_7(self):
         """Действие 7: Парсинг актуальных товаров Comcenter"""
@@ -208,7 +232,15 @@ class ComcenterGUI:
             self.output_handler.log("Сессия не инициализирована. Пожалуйста, перезапустите приложение.")
             return
         session, headers = self.session_info
-        self.run_in_thread(lambda: parse_comcenter_products(session, headers, self.output_handler, self.cancel_flag))
+        self.run_in_thread(lambda: self.parser.parse_comcenter_products(session, headers, self.output_handler, self.cancel_flag))
+
+    def run_action_8(self):
+        """Действие 8: Быстрое обновление цен и наличия"""
+        if not self.session_info:
+            self.output_handler.log("Сессия не инициализирована. Пожалуйста, перезапустите приложение.")
+            return
+        session, headers = self.session_info
+        self.run_in_thread(lambda: self.parser.refresh_prices(session, headers, self.output_handler, self.cancel_flag))
 
     def exit(self):
         """Выход из приложения"""
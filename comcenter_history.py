@@ -0,0 +1,255 @@
+import gzip
+import json
+import os
+import time
+import zlib
+import datetime
+from contextlib import contextmanager
+
+# Журнал снимков цен и наличия (путь задается в comcenter_parser.history_file):
+# каждый запуск дописывает отдельный gzip-блок с изменениями относительно
+# предыдущего известного состояния. Блок сжимается заранее и дописывается одной
+# записью под блокировкой файла; недописанный блок в конце (сбой во время записи)
+# при чтении пропускается, а при следующей записи отрезается.
+# Каждые checkpoint_interval запусков рядом с журналом (в каталоге <журнал>.checkpoints)
+# сохраняется полное состояние и смещение в журнале после этого запуска: восстановление
+# состояния начинается с ближайшей контрольной точки и читает только более поздние блоки
+
+lock_timeout = 30
+checkpoint_interval = 50
+
+# Поля товара, которые попадают в историю (порядок важен: записи хранятся списками)
+SNAPSHOT_FIELDS = ("availability", "in_transit", "wholesale_price", "retail_price")
+
+def snapshot_entry(record):
+    """Приведение записи товара к компактному виду для журнала"""
+    return [record.get(field, 0) for field in SNAPSHOT_FIELDS]
+
+@contextmanager
+def file_lock(lock_path, timeout=lock_timeout):
+    """Монопольная блокировка между процессами (снимается ОС, если процесс упал)"""
+    f = open(lock_path, 'a+b')
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Не удалось заблокировать {lock_path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    finally:
+        f.close()
+
+def read_members(path, offset=0):
+    """Запуски из журнала, начиная с байта offset: пары (запуск, смещение конца его блока)
+
+    Чтение останавливается на первом поврежденном или недописанном блоке.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = memoryview(f.read())
+    pos = 0
+    while pos < len(data):
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            text = decompressor.decompress(data[pos:])
+            if not decompressor.eof:
+                return
+            pos = len(data) - len(decompressor.unused_data)
+            runs = [json.loads(line) for line in text.decode('utf-8').splitlines() if line.strip()]
+        except (zlib.error, UnicodeDecodeError, ValueError):
+            return
+        for run in runs:
+            yield run, offset + pos
+
+def iter_runs(path):
+    """Последовательное чтение всех запусков из журнала"""
+    for run, _ in read_members(path):
+        yield run
+
+def checkpoint_dir(path):
+    return path + ".checkpoints"
+
+def save_checkpoint(path, run_id, offset, state):
+    """Контрольная точка: полное состояние после запуска run_id (атомарная запись)"""
+    directory = checkpoint_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    blob = gzip.compress(json.dumps(
+        {"run": run_id, "offset": offset, "state": state}, ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8'))
+    target = os.path.join(directory, f"run_{run_id:08d}.json.gz")
+    tmp_path = target + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, target)
+
+def load_checkpoint(path, until_run=None):
+    """Ближайшая контрольная точка не позже until_run: (состояние, номер запуска, смещение)"""
+    directory = checkpoint_dir(path)
+    if os.path.isdir(directory) and os.path.exists(path):
+        size = os.path.getsize(path)
+        run_ids = sorted(
+            (int(name[4:12]) for name in os.listdir(directory)
+             if name.startswith("run_") and name.endswith(".json.gz") and name[4:12].isdigit()),
+            reverse=True
+        )
+        for run_id in run_ids:
+            if until_run is not None and run_id > until_run:
+                continue
+            try:
+                with gzip.open(os.path.join(directory, f"run_{run_id:08d}.json.gz"), 'rt', encoding='utf-8') as f:
+                    checkpoint = json.load(f)
+            except (OSError, EOFError, ValueError):
+                continue
+            # Контрольная точка от другого (удаленного или замененного) журнала не подходит
+            if checkpoint["offset"] <= size:
+                return checkpoint["state"], checkpoint["run"], checkpoint["offset"]
+    return {}, 0, 0
+
+def replay(path, until_run=None):
+    """Состояние на момент запуска until_run
+
+    Возвращает (ID -> запись, номер запуска, смещение конца его блока, номер запуска контрольной точки).
+    """
+    state, checkpoint_run, end = load_checkpoint(path, until_run)
+    last_run = checkpoint_run
+    for run, run_end in read_members(path, end):
+        if until_run is not None and run["run"] > until_run:
+            break
+        state.update(run["changes"])
+        last_run = run["run"]
+        end = run_end
+    return state, last_run, end, checkpoint_run
+
+def load_state(path, until_run=None):
+    """Восстановление состояния (ID -> запись) на момент запуска until_run"""
+    state, last_run, _, _ = replay(path, until_run)
+    return state, last_run
+
+def record_snapshot(parsed_data, source, output_handler, path):
+    """Запись в журнал изменений по результатам очередного запуска парсинга
+
+    Сохраняются только товары, у которых изменились наличие, количество в пути
+    или цены. Отсутствие товара в запуске не считается удалением: разные действия
+    обрабатывают разные наборы ID.
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Блокировка: GUI, фоновый режим и консоль могут записывать историю одновременно
+        with file_lock(path + ".lock"):
+            state, last_run, end, checkpoint_run = replay(path)
+            if os.path.exists(path) and os.path.getsize(path) > end:
+                output_handler.log(f"История: поврежденный конец журнала ({os.path.getsize(path) - end} байт) отброшен")
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+
+            changes = {}
+            for product_id, record in parsed_data.items():
+                entry = snapshot_entry(record)
+                if state.get(product_id) != entry:
+                    changes[product_id] = entry
+
+            run = {
+                "run": last_run + 1,
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "source": source,
+                "fields": list(SNAPSHOT_FIELDS),
+                "changes": changes,
+            }
+            # Каждый запуск - отдельный gzip-член, сжатый заранее и дописанный одной записью
+            blob = gzip.compress((json.dumps(run, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8'))
+            with open(path, 'ab') as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            if run["run"] - checkpoint_run >= checkpoint_interval:
+                state.update(changes)
+                save_checkpoint(path, run["run"], end + len(blob), state)
+        output_handler.log(f"История: запуск #{run['run']}, изменилось {len(changes)} из {len(parsed_data)} товаров")
+        return run["run"]
+    except Exception as e:
+        output_handler.log(f"Ошибка при записи истории в {path}: {e}")
+        return None
+
+def list_runs(path):
+    """Список запусков без самих изменений"""
+    return [
+        {"run": run["run"], "timestamp": run["timestamp"], "source": run["source"], "changed": len(run["changes"])}
+        for run in iter_runs(path)
+    ]
+
+def changes_since(run_id, path):
+    """Что изменилось после запуска run_id
+
+    Возвращает словарь ID -> {"before": ..., "after": ...}, где значения - словари
+    полей SNAPSHOT_FIELDS (before равен None для новых товаров).
+    """
+    before, _, end, _ = replay(path, run_id)
+    after = {}
+    for run, _ in read_members(path, end):
+        after.update(run["changes"])
+
+    result = {}
+    for product_id, entry in after.items():
+        old = before.get(product_id)
+        if old == entry:
+            continue
+        result[product_id] = {
+            "before": dict(zip(SNAPSHOT_FIELDS, old)) if old is not None else None,
+            "after": dict(zip(SNAPSHOT_FIELDS, entry)),
+        }
+    return result
+
+def price_history(product_id, path):
+    """История изменения полей одного товара по запускам"""
+    return [
+        {"run": run["run"], "timestamp": run["timestamp"], **dict(zip(SNAPSHOT_FIELDS, run["changes"][product_id]))}
+        for run in iter_runs(path)
+        if product_id in run["changes"]
+    ]
+
+def history_main():
+    """Консольный просмотр истории"""
+    import argparse
+    from comcenter_parser import history_file
+    parser = argparse.ArgumentParser(description="История цен и наличия товаров Comcenter")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("runs", help="список запусков")
+    since = sub.add_parser("since", help="изменения после запуска")
+    since.add_argument("run", type=int)
+    product = sub.add_parser("product", help="история одного товара")
+    product.add_argument("product_id")
+    args = parser.parse_args()
+
+    if args.command == "runs":
+        result = list_runs(history_file)
+    elif args.command == "since":
+        result = changes_since(args.run, history_file)
+    else:
+        result = price_history(args.product_id, history_file)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    history_main()
@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import time
+
+# Общий слой записи JSON-файлов:
+# - orjson, если установлен (в несколько раз быстрее json), иначе стандартный json;
+# - компактный режим без отступов (COMCENTER_JSON_COMPACT=1 в .env или окружении),
+#   иначе отступ всегда pretty_indent пробела (orjson других отступов не поддерживает,
+#   поэтому вид файлов не зависит от того, установлен ли он);
+# - атомарная публикация: запись во временный файл в той же папке и os.replace,
+#   поэтому читатели видят либо старый, либо новый файл целиком, но не обрезанный.
+# Формат остается JSON в UTF-8, существующие читатели (json.load) работают без изменений
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+pretty_indent = 2
+# Повторы os.replace: в Windows замена не удается, пока файл открыт другим процессом
+replace_attempts = 5
+replace_retry_delay = 0.2
+
+def compact_default():
+    return os.getenv("COMCENTER_JSON_COMPACT", "").strip().lower() in ("1", "true", "yes")
+
+def dumps(data, compact=None):
+    """Сериализация в байты UTF-8"""
+    if compact is None:
+        compact = compact_default()
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2)
+        except TypeError:
+            pass
+    if compact:
+        text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=pretty_indent)
+    return text.encode('utf-8')
+
+def replace_file(tmp_path, path):
+    for attempt in range(replace_attempts):
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            if attempt == replace_attempts - 1:
+                raise
+            time.sleep(replace_retry_delay)
+
+def read_umask():
+    """Текущий umask без его изменения, где это возможно (Linux), иначе через os.umask"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+# umask читается один раз при импорте: os.umask меняет его для всего процесса,
+# и файлы, созданные в это время другими потоками, получили бы неверные права
+process_umask = read_umask()
+
+def file_mode(path):
+    """Права для публикуемого файла: как у заменяемого, иначе по umask (mkstemp создает 0600)"""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except OSError:
+        return 0o666 & ~process_umask
+
+def write_json(path, data, compact=None):
+    """Атомарная запись JSON в файл"""
+    return write_file(path, dumps(data, compact))
+
+def write_file(path, body):
+    """Атомарная запись байтов в файл"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, file_mode(path))
+        replace_file(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(body)
@@ -0,0 +1,120 @@
+import math
+import os
+import time
+import datetime
+from contextlib import contextmanager
+
+from comcenter_jsonio import write_json
+
+# Замеры времени по этапам обработки: сетевой запрос до заголовков ответа (ttfb),
+# загрузка тела (download), разбор HTML (html_parse), извлечение данных (extract),
+# запись JSON (json_write). requests переиспользует соединения из пула, поэтому
+# DNS и установка соединения входят в ttfb и отдельно не замеряются
+
+def percentile(sorted_values, p):
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    # Ближайший ранг: ceil(p * n / 100), нумерация с 1
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p * len(sorted_values) / 100) - 1))
+    return sorted_values[index]
+
+class RunMetrics:
+    """Сбор метрик одного запуска действия"""
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.datetime.now()
+        self.start = time.perf_counter()
+        self.timings = {}
+        self.items = 0
+        self.errors = 0
+        self.bytes_downloaded = 0
+        self.counters = {}
+
+    def record(self, stage, seconds):
+        self.timings.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def stage(self, stage):
+        """Замер времени блока кода"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def get(self, session, url, **kwargs):
+        """session.get с раздельным замером ttfb и загрузки тела"""
+        start = time.perf_counter()
+        response = session.get(url, stream=True, **kwargs)
+        headers_received = time.perf_counter()
+        try:
+            content = response.content
+        finally:
+            response.close()
+        done = time.perf_counter()
+        self.record("ttfb", headers_received - start)
+        self.record("download", done - headers_received)
+        self.record("request", done - start)
+        self.bytes_downloaded += len(content)
+        return response
+
+    def count(self, name, n=1):
+        """Счетчик событий (например, совпадений отпечатков страниц)"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def item_done(self, ok=True):
+        self.items += 1
+        if not ok:
+            self.errors += 1
+
+    def succeeded(self, max_error_share=0.0):
+        """Доля элементов с ошибками не больше max_error_share"""
+        return self.errors <= self.items * max_error_share
+
+    def report(self):
+        """Сводка: p50/p95/p99 по этапам и пропускная способность"""
+        elapsed = time.perf_counter() - self.start
+        stages = {}
+        for stage, values in self.timings.items():
+            values = sorted(values)
+            stages[stage] = {
+                "count": len(values),
+                "total": round(sum(values), 4),
+                "mean": round(sum(values) / len(values), 4),
+                "p50": round(percentile(values, 50), 4),
+                "p95": round(percentile(values, 95), 4),
+                "p99": round(percentile(values, 99), 4),
+                "max": round(values[-1], 4),
+            }
+        return {
+            "action": self.name,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "elapsed": round(elapsed, 3),
+            "items": self.items,
+            "errors": self.errors,
+            "items_per_sec": round(self.items / elapsed, 3) if elapsed > 0 else 0.0,
+            "bytes_downloaded": self.bytes_downloaded,
+            "counters": dict(self.counters),
+            "stages": stages,
+        }
+
+    def finish(self, output_handler, metrics_dir):
+        """Вывод сводки в лог и сохранение отчета в JSON"""
+        report = self.report()
+        output_handler.log(
+            f"Метрики {self.name}: {report['items']} элементов за {report['elapsed']:.1f} с "
+            f"({report['items_per_sec']:.2f}/с), ошибок: {report['errors']}"
+        )
+        for stage, s in report["stages"].items():
+            output_handler.log(
+                f"  {stage}: p50 {s['p50'] * 1000:.1f} мс, p95 {s['p95'] * 1000:.1f} мс, "
+                f"p99 {s['p99'] * 1000:.1f} мс, всего {s['total']:.1f} с"
+            )
+        try:
+            path = os.path.join(metrics_dir, f"{self.name}_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+            write_json(path, report)
+            output_handler.log(f"Отчет о метриках сохранен в '{path}'.")
+        except Exception as e:
+            output_handler.log(f"Ошибка при сохранении отчета о метриках: {e}")
+        return report
@@ -1,22 +1,45 @@
 from dotenv import load_dotenv
-import urllib3
 import requests
-import pandas as pd
 import json
 import os
 import re
-from bs4 import BeautifulSoup
-import uuid
-from tqdm import tqdm
 import datetime
+import time
+import hashlib
+import socket
+import threading
+import tempfile
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from comcenter_history import record_snapshot
+from comcenter_search import build_search_index
+from comcenter_metrics import RunMetrics
+from comcenter_jsonio import write_json
+from comcenter_fingerprints import FingerprintStore, page_digest
+from comcenter_priority import prioritize, compatibility_degree, load_fetch_times, record_fetch_times
+
+# xlrd и BeautifulSoup импортируются внутри функций, которым они нужны:
+# это заметно ускоряет запуск GUI и консольного меню
 
 # Путь к файлу сертификата
 cert_path = "C:/!Work/COMCENTER/fullchain.pem"
 
+# Адрес сайта (переопределяется, например, бенчмарком с локальным сервером)
+base_url = "https://comcenter.ru"
+xls_path = "/Content/PriceList/price.xls"
+
 # Путь для сохранения данных
 output_dir = "COMCENTER.ru_database"
 log_file = "comcenter_parser.log"
-xls_url = "https://comcenter.ru/Content/PriceList/price.xls"
+# Прайс-лист и сведения о нем (ETag, Last-Modified, хеш) для условного скачивания
+xls_file = "temp_price.xls"
+xls_meta_file = xls_file + ".meta.json"
+# Прайс-лист старше этого возраста (в секундах) перепроверяется на сервере
+xls_max_age = 60 * 60
+xls_chunk_size = 64 * 1024
+# Список принтеров моложе этого возраста (в секундах) не запрашивается повторно при запуске GUI
+printers_max_age = 24 * 60 * 60
 xls_output_file = os.path.join(output_dir, "DATABASE_recent.json")
 printers_output_file = os.path.join(output_dir, "Laser_Printers.json")
 compatibility_output_file = os.path.join(output_dir, "PRINTERS_compatibility.json")
@@ -24,6 +47,30 @@ compatibility_actual_output_file = os.path.join(output_dir, "PRINTERS_compatibil
 cartridges_parts_output_file = os.path.join(output_dir, "DATABASE_cartridges&Parts.json")
 all_cartridges_parts_output_file = os.path.join(output_dir, "DATABASE_all_cartridges&Parts.json")
 comcenter_products_output_file = os.path.join(output_dir, "DATABASE_comcenter_products.json")
+history_file = os.path.join(output_dir, "history", "snapshots.jsonl.gz")
+metrics_dir = os.path.join(output_dir, "metrics")
+search_index_file = os.path.join(output_dir, "search_index.sqlite")
+work_queue_file = os.path.join(output_dir, "work_queue.sqlite")
+# Время последнего успешного обновления товаров (для приоритета устаревших)
+fetch_times_file = os.path.join(output_dir, "fetch_times.json")
+# Отпечатки страниц и извлеченные записи (повторный разбор только измененных страниц)
+fingerprints_file = os.path.join(output_dir, "page_fingerprints.sqlite")
+# Базы, из которых строится поисковый индекс (при совпадении ID приоритет у последней)
+search_index_sources = [all_cartridges_parts_output_file, cartridges_parts_output_file, comcenter_products_output_file]
+# Доля страниц с ошибками, при которой парсинг еще считается выполненным
+# (необновленные товары берутся из прежней базы и обновятся при следующем запуске)
+max_item_error_share = 0.05
+
+# Быстрое извлечение наличия и цен из байтов страницы без построения дерева BeautifulSoup
+# (те же элементы, что выбирает parse_product_page)
+product_count_marker = b'product-count'
+price_container_marker = b'product-price-container'
+class_tag_re = re.compile(rb'<(\w+)\b[^>]*\bclass="([^"]*)"')
+div_tag_re = re.compile(rb'<(/?)div[\s>/]', re.IGNORECASE)
+price_span_re = re.compile(rb'<span\b[^>]*\bdata-bind="([^"]*getBrowsingPrice[^"]*)"')
+browsing_price_re = re.compile(rb'getBrowsingPrice\((\d+\.\d+), (\d+\.?\d*)\)')
+fast_path_chunk_size = 16 * 1024
+fast_path_drain_limit = 64 * 1024
 
 class ConsoleOutputHandler:
     """Обработчик вывода для консоли с записью в файл"""
@@ -38,19 +85,133 @@ class ConsoleOutputHandler:
         percentage = (current / total) * 100
         print(f"Прогресс: {current}/{total} ({percentage:.1f}%)")
 
+class OperationCancelled(Exception):
+    """Операция прервана через CancelFlag"""
+
+# Соединения, через которые идут запросы текущего CancelFlag.call (по потокам)
+call_state = threading.local()
+
 class CancelFlag:
-    """Флаг для отслеживания отмены операции"""
+    """Флаг для отслеживания отмены операции (потокобезопасный)
+
+    Запросы, выполняемые через call в сессии из setup_session, регистрируют свои
+    соединения во флаге; cancel закрывает их сокеты, и ожидание ответа или чтение
+    тела сразу завершается ошибкой.
+    """
     def __init__(self):
-        self.cancelled = False
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.connections = set()
 
     def cancel(self):
-        self.cancelled = True
+        self.event.set()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.abort()
 
     def is_cancelled(self):
-        return self.cancelled
+        return self.event.is_set()
+
+    def track(self, connection):
+        with self.lock:
+            self.connections.add(connection)
+        call_state.connections.append(connection)
+        if self.is_cancelled():
+            connection.abort()
+
+    def call(self, func, *args, **kwargs):
+        """Выполнение блокирующего вызова (HTTP-запроса) с прерыванием по отмене
+
+        Вызов выполняется в текущем потоке; при отмене его соединения закрываются,
+        и вызов завершается исключением OperationCancelled.
+        """
+        if self.is_cancelled():
+            raise OperationCancelled()
+        previous = getattr(call_state, "flag", None), getattr(call_state, "connections", None)
+        call_state.flag, call_state.connections = self, []
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            if self.is_cancelled():
+                raise OperationCancelled()
+            raise
+        finally:
+            with self.lock:
+                self.connections.difference_update(call_state.connections)
+            call_state.flag, call_state.connections = previous
+        if self.is_cancelled():
+            raise OperationCancelled()
+        return result
+
+class CancellableConnectionMixin:
+    """Соединение urllib3, которое регистрируется в CancelFlag текущего вызова"""
+    def request(self, *args, **kwargs):
+        flag = getattr(call_state, "flag", None)
+        if flag is not None:
+            flag.track(self)
+        result = super().request(*args, **kwargs)
+        # Отмена во время установки соединения (сокета еще не было) - закрываем сейчас
+        if flag is not None and flag.is_cancelled():
+            self.abort()
+        return result
+
+    def abort(self):
+        # shutdown, а не close: заблокированное в другом потоке чтение сразу получает отказ
+        sock = self.sock
+        if sock is not None:
+            try:
+                socket.socket.shutdown(sock, socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class CancellableHTTPConnection(CancellableConnectionMixin, HTTPConnection):
+    pass
+
+class CancellableHTTPSConnection(CancellableConnectionMixin, HTTPSConnection):
+    pass
+
+class CancellableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CancellableHTTPConnection
+
+class CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CancellableHTTPSConnection
+
+class CancellableAdapter(HTTPAdapter):
+    """Адаптер requests с соединениями, которые CancelFlag может прервать"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CancellableHTTPConnectionPool,
+            "https": CancellableHTTPSConnectionPool,
+        }
+
+def create_session():
+    session = requests.Session()
+    session.mount("http://", CancellableAdapter())
+    session.mount("https://", CancellableAdapter())
+    return session
+
+def merge_with_existing(data, output_file, output_handler):
+    """Дополнение частичных результатов отмененного запуска данными из существующего файла
+
+    Записи, которые запуск успел обновить, берутся из data, остальные - из файла,
+    чтобы прерванный запуск не затирал результаты предыдущего.
+    """
+    if not os.path.exists(output_file):
+        return data
+    try:
+        with open(output_file, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    except Exception as e:
+        output_handler.log(f"Ошибка при чтении файла {output_file}: {e}")
+        return data
+    existing.update(data)
+    return existing
 
 def setup_session(output_handler):
     """Настройка сессии с учетом сертификата и авторизации"""
+    from bs4 import BeautifulSoup
     if not os.path.exists(cert_path):
         output_handler.log(f"Файл сертификата {cert_path} не найден")
         return None
@@ -65,16 +226,16 @@ def setup_session(output_handler):
         return None
 
     # Создаем сессию
-    session = requests.Session()
+    session = create_session()
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.85 Safari/537.36',
-        'Referer': 'https://comcenter.ru/',
+        'Referer': f'{base_url}/',
         'Content-Type': 'application/x-www-form-urlencoded',
     }
 
     # Проверяем доступность сайта
     try:
-        response = requests.get("https://comcenter.ru", headers=headers, verify=cert_path, timeout=10)
+        response = requests.get(base_url, headers=headers, verify=cert_path, timeout=10)
         if response.status_code != 200:
             output_handler.log("Не удалось подключиться к сайту comcenter.ru")
             return None
@@ -83,7 +244,7 @@ def setup_session(output_handler):
         return None
 
     # Авторизация
-    login_url = 'https://comcenter.ru/Account/LogOn'
+    login_url = f'{base_url}/Account/LogOn'
     login_data = {
         'UserName': LOGIN,
         'Password': PASSWORD,
@@ -105,11 +266,12 @@ def setup_session(output_handler):
         return None
 
 def get_laser_printers_database(session, headers, output_handler, cancel_flag):
-    """Получение базы данных лазерных принтеров"""
-    url = 'https://comcenter.ru/Store/Browse/400000006580/printery-lazernye-i-mfu'
+    """Получение базы данных лазерных принтеров; True - база сохранена"""
+    from bs4 import BeautifulSoup
+    url = f'{base_url}/Store/Browse/400000006580/printery-lazernye-i-mfu'
 
     try:
-        response = session.get(url, headers=headers, timeout=10, verify=cert_path)
+        response = cancel_flag.call(session.get, url, headers=headers, timeout=10, verify=cert_path)
         response.raise_for_status()
         soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -117,7 +279,7 @@ def get_laser_printers_database(session, headers, output_handler, cancel_flag):
         for a_tag in soup.select('a.cells-wrapper'):
             if cancel_flag.is_cancelled():
                 output_handler.log("Операция отменена")
-                return
+                return False
             href = a_tag.get('href')
             if href and '/Store/Details/' in href:
                 match = re.search(r'/Store/Details/(\d{12})', href)
@@ -125,184 +287,342 @@ def get_laser_printers_database(session, headers, output_handler, cancel_flag):
                     product_ids.append(match.group(1))
 
         product_ids = list(set(product_ids))
-        os.makedirs(output_dir, exist_ok=True)
-        with open(printers_output_file, 'w', encoding='utf-8') as f:
-            json.dump(product_ids, f, ensure_ascii=False, indent=4)
+        write_json(printers_output_file, product_ids)
         output_handler.log(f"Найдено {len(product_ids)} товаров. ID сохранены в '{printers_output_file}'.")
+        return True
+    except OperationCancelled:
+        output_handler.log("Операция отменена")
     except requests.exceptions.RequestException as e:
         output_handler.log(f"Ошибка при загрузке страницы: {e}")
+    return False
 
-def download_xls_file(session, headers, output_handler, cancel_flag):
-    """Скачивание xls-файла с использованием сессии"""
+def load_xls_meta():
+    """Сведения о последнем скачанном прайс-листе"""
+    if not os.path.exists(xls_meta_file) or not os.path.exists(xls_file):
+        return {}
     try:
-        response = session.get(xls_url, headers=headers, verify=cert_path, timeout=10)
+        with open(xls_meta_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_xls_meta(meta):
+    write_json(xls_meta_file, meta)
+
+def fetch_xls_file(session, headers, cancel_flag, meta):
+    """Условное потоковое скачивание прайс-листа во временный файл с атомарной подменой
+
+    Возвращает обновленные сведения о файле; поле "changed" показывает, изменилось ли содержимое.
+    """
+    request_headers = dict(headers)
+    if meta.get("etag"):
+        request_headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        request_headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = session.get(base_url + xls_path, headers=request_headers, verify=cert_path, timeout=10, stream=True)
+    try:
+        if response.status_code == 304:
+            return dict(meta, checked_at=time.time(), changed=False)
         response.raise_for_status()
-        with open("temp_price.xls", "wb") as file:
-            file.write(response.content)
-        output_handler.log("Файл успешно скачан")
+
+        # Уникальное имя временного файла: несколько процессов могут скачивать прайс-лист одновременно
+        fd, part_file = tempfile.mkstemp(
+            prefix=os.path.basename(xls_file) + ".", suffix=".part", dir=os.path.dirname(os.path.abspath(xls_file))
+        )
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in response.iter_content(chunk_size=xls_chunk_size):
+                    if cancel_flag.is_cancelled():
+                        raise OperationCancelled()
+                    file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            os.replace(part_file, xls_file)
+        finally:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+    finally:
+        response.close()
+
+    sha256 = digest.hexdigest()
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": sha256,
+        "size": size,
+        "parsed_sha256": meta.get("parsed_sha256"),
+        "checked_at": time.time(),
+        "changed": sha256 != meta.get("sha256"),
+    }
+
+def download_xls_file(session, headers, output_handler, cancel_flag):
+    """Скачивание xls-файла с использованием сессии
+
+    Файл скачивается, только если изменился на сервере (ETag/Last-Modified, затем
+    сравнение хеша содержимого).
+    """
+    try:
+        meta = cancel_flag.call(fetch_xls_file, session, headers, cancel_flag, load_xls_meta())
+        save_xls_meta(meta)
+        if meta["changed"]:
+            output_handler.log(f"Файл успешно скачан ({meta['size'] / 1024:.0f} КБ)")
+        else:
+            output_handler.log("Прайс-лист не изменился с прошлого скачивания")
         return True
-    except requests.exceptions.RequestException as e:
+    except OperationCancelled:
+        output_handler.log("Скачивание файла отменено")
+        return False
+    except (requests.exceptions.RequestException, OSError) as e:
         output_handler.log(f"Ошибка при скачивании файла: {e}")
         return False
 
+def iter_xls_rows(path, columns=None, cancel_flag=None):
+    """Построчное чтение xls-файла: пары (номер листа, список значений нужных колонок)
+
+    columns=None - все колонки. Первая строка каждого листа - заголовок и пропускается
+    (как при чтении через pandas). Значения типизированы: целые числа - int, дробные - float,
+    текст - str, пустые ячейки - None. Листы загружаются по одному и выгружаются после
+    чтения, DataFrame не строится.
+    """
+    import gc
+    import xlrd
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        for sheet_index, sheet_name in enumerate(book.sheet_names()):
+            if cancel_flag is not None and cancel_flag.is_cancelled():
+                raise OperationCancelled()
+            sheet = book.sheet_by_name(sheet_name)
+            sheet_columns = range(sheet.ncols) if columns is None else [c for c in columns if c < sheet.ncols]
+            if columns is not None and len(sheet_columns) < len(columns):
+                book.unload_sheet(sheet_name)
+                continue
+            for row in range(1, sheet.nrows):
+                values = []
+                for column in sheet_columns:
+                    cell_type = sheet.cell_type(row, column)
+                    value = sheet.cell_value(row, column)
+                    if cell_type == xlrd.XL_CELL_NUMBER:
+                        value = int(value) if value.is_integer() else value
+                    elif cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                        value = None
+                    values.append(value)
+                yield sheet_index, values
+            # Объект листа xlrd содержит циклические ссылки на себя - без сборки мусора
+            # ячейки прочитанного листа остались бы в памяти до следующего цикла gc
+            sheet = None
+            book.unload_sheet(sheet_name)
+            gc.collect()
+    finally:
+        book.release_resources()
+
+def xls_code(value):
+    """12-значный код товара из значения ячейки или None"""
+    text = str(value) if isinstance(value, int) else value
+    if isinstance(text, str) and re.match(r'^\d{12}$', text):
+        return text
+    return None
+
+def xls_count(value):
+    """Количество из ячейки ("Наличие", "В пути"), 0 для пустых и нечисловых значений"""
+    if value is None:
+        return 0
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return 0
+
 def process_xls_file(output_handler, cancel_flag):
     """Обработка xls-файла для поиска 12-значных номеров"""
     try:
-        xls = pd.ExcelFile("temp_price.xls")
-        twelve_digit_numbers = []
-        for sheet_name in xls.sheet_names:
-            if cancel_flag.is_cancelled():
-                output_handler.log("Операция отменена")
-                return None
-            df = pd.read_excel(xls, sheet_name=sheet_name, dtype=str)
-            for column in df.columns:
-                for value in df[column]:
-                    if isinstance(value, str) and re.match(r'^\d{12}$', value):
-                        twelve_digit_numbers.append(value)
-        return twelve_digit_numbers
+        # Порядок в DATABASE_recent.json как при чтении через pandas: лист -> колонка -> строка
+        numbers_by_column = {}
+        for sheet_index, values in iter_xls_rows(xls_file, cancel_flag=cancel_flag):
+            for column, value in enumerate(values):
+                code = xls_code(value)
+                if code:
+                    numbers_by_column.setdefault((sheet_index, column), []).append(code)
+        return [code for key in sorted(numbers_by_column) for code in numbers_by_column[key]]
+    except OperationCancelled:
+        output_handler.log("Операция отменена")
+        return None
     except Exception as e:
         output_handler.log(f"Ошибка при обработке xls файла: {e}")
         return None
 
 def save_to_json(data, filename, output_handler):
-    """Сохранение данных в JSON"""
+    """Сохранение данных в JSON; True - файл записан"""
     try:
-        os.makedirs(output_dir, exist_ok=True)
         filepath = os.path.join(output_dir, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        write_json(filepath, data)
         output_handler.log(f"Данные сохранены в {filepath}")
+        return True
     except Exception as e:
         output_handler.log(f"Ошибка при сохранении JSON: {e}")
+        return False
 
 def process_xls_database(session, headers, output_handler, cancel_flag):
-    """Получение базы данных из xls-файла"""
-    if download_xls_file(session, headers, output_handler, cancel_flag):
-        numbers = process_xls_file(output_handler, cancel_flag)
-        if numbers:
-            save_to_json(numbers, "DATABASE_recent.json", output_handler)
-            try:
-                os.remove("temp_price.xls")
-            except:
-                pass
+    """Получение базы данных из xls-файла; True - база актуальна"""
+    if not download_xls_file(session, headers, output_handler, cancel_flag):
+        return False
+    # Прайс-лист сохраняется для последующих действий и условного скачивания;
+    # повторный разбор не нужен, если содержимое не менялось с прошлого раза
+    meta = load_xls_meta()
+    if os.path.exists(xls_output_file) and meta.get("sha256") and meta.get("sha256") == meta.get("parsed_sha256"):
+        output_handler.log(f"Прайс-лист не изменился, '{xls_output_file}' актуален")
+        return True
+    numbers = process_xls_file(output_handler, cancel_flag)
+    if not numbers or not save_to_json(numbers, "DATABASE_recent.json", output_handler):
+        return False
+    meta["parsed_sha256"] = meta.get("sha256")
+    save_xls_meta(meta)
+    return True
+
+def parse_compatibility_page(soup):
+    """Извлечение ID картриджей и запчастей со страницы принтера"""
+    grid_sections = soup.select('div.grid.space-top')
+    cartridge_ids = []
+    part_ids = []
+
+    found_cartridges = False
+    found_parts = False
+
+    for grid in grid_sections:
+        header = grid.select_one('div.grid-header h2.title')
+        if not header:
+            continue
+
+        section_title = header.text.strip()
+
+        if section_title == "Картриджи":
+            found_cartridges = True
+            links = grid.select('a.cells-wrapper')
+            for link in links:
+                href = link.get('href')
+                if href and '/Store/Details/' in href:
+                    match = re.search(r'/Store/Details/(\d{12})', href)
+                    if match:
+                        cartridge_ids.append(match.group(1))
+
+        elif section_title == "Запчасти" and found_cartridges:
+            found_parts = True
+            links = grid.select('a.cells-wrapper')
+            for link in links:
+                href = link.get('href')
+                if href and '/Store/Details/' in href:
+                    match = re.search(r'/Store/Details/(\d{12})', href)
+                    if match:
+                        part_ids.append(match.group(1))
+
+    cartridge_ids = list(set(cartridge_ids))
+    part_ids = list(set(part_ids))
+
+    return {
+        "cartridges": cartridge_ids,
+        "parts": part_ids
+    }
 
 def parse_printer_compatibility(session, headers, output_handler, cancel_flag):
-    """Парсинг совместимости для всех принтеров из Laser_Printers.json"""
+    """Парсинг совместимости для всех принтеров из Laser_Printers.json; True - действие выполнено"""
+    from bs4 import BeautifulSoup
     if not os.path.exists(printers_output_file):
         output_handler.log(f"Файл {printers_output_file} не найден")
-        return
+        return False
 
     try:
         with open(printers_output_file, 'r', encoding='utf-8') as f:
             printer_ids = json.load(f)
     except Exception as e:
         output_handler.log(f"Ошибка при чтении файла {printers_output_file}: {e}")
-        return
+        return False
 
     if not printer_ids:
         output_handler.log("Список ID принтеров пуст")
-        return
+        return False
 
     compatibility_data = {}
     total = len(printer_ids)
     current = 0
+    metrics = RunMetrics("parse_printer_compatibility")
+    fingerprints = FingerprintStore(fingerprints_file)
 
     for printer_id in printer_ids:
         if cancel_flag.is_cancelled():
-            output_handler.log("Операция отменена")
-            return
+            break
         current += 1
         output_handler.progress(current, total)
-        url = f'https://comcenter.ru/Store/Details/{printer_id}'
+        url = f'{base_url}/Store/Details/{printer_id}'
         output_handler.log(f"Обрабатывается принтер ID: {printer_id}")
 
         try:
-            response = session.get(url, headers=headers, timeout=10, verify=cert_path)
+            response = cancel_flag.call(metrics.get, session, url, headers=headers, timeout=10, verify=cert_path)
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            grid_sections = soup.select('div.grid.space-top')
-            cartridge_ids = []
-            part_ids = []
-
-            found_cartridges = False
-            found_parts = False
-
-            for grid in grid_sections:
-                header = grid.select_one('div.grid-header h2.title')
-                if not header:
-                    continue
-
-                section_title = header.text.strip()
-
-                if section_title == "Картриджи":
-                    found_cartridges = True
-                    links = grid.select('a.cells-wrapper')
-                    for link in links:
-                        href = link.get('href')
-                        if href and '/Store/Details/' in href:
-                            match = re.search(r'/Store/Details/(\d{12})', href)
-                            if match:
-                                cartridge_ids.append(match.group(1))
-
-                elif section_title == "Запчасти" and found_cartridges:
-                    found_parts = True
-                    links = grid.select('a.cells-wrapper')
-                    for link in links:
-                        href = link.get('href')
-                        if href and '/Store/Details/' in href:
-                            match = re.search(r'/Store/Details/(\d{12})', href)
-                            if match:
-                                part_ids.append(match.group(1))
-
-            cartridge_ids = list(set(cartridge_ids))
-            part_ids = list(set(part_ids))
-
-            compatibility_data[printer_id] = {
-                "cartridges": cartridge_ids,
-                "parts": part_ids
-            }
-
-            output_handler.log(f"Принтер {printer_id}: найдено картриджей: {len(cartridge_ids)}, запчастей: {len(part_ids)}")
-
+            digest = page_digest(response.content, "compatibility")
+            entry = fingerprints.lookup(url, digest)
+            if entry is None:
+                metrics.count("page_changed")
+                with metrics.stage("html_parse"):
+                    soup = BeautifulSoup(response.text, 'html.parser')
+                with metrics.stage("extract"):
+                    entry = parse_compatibility_page(soup)
+                fingerprints.store(url, digest, entry)
+            else:
+                metrics.count("page_unchanged")
+            compatibility_data[printer_id] = entry
+            metrics.item_done()
+
+            output_handler.log(f"Принтер {printer_id}: найдено картриджей: {len(entry['cartridges'])}, запчастей: {len(entry['parts'])}")
+
+        except OperationCancelled:
+            break
         except requests.exceptions.RequestException as e:
+            metrics.item_done(ok=False)
             output_handler.log(f"Ошибка при загрузке страницы для принтера {printer_id}: {e}")
             continue
 
+    fingerprints.report(output_handler)
+    fingerprints.close()
+    if cancel_flag.is_cancelled():
+        output_handler.log(f"Операция отменена, сохраняются результаты для {len(compatibility_data)} обработанных принтеров")
+        compatibility_data = merge_with_existing(compatibility_data, compatibility_output_file, output_handler)
+
     if compatibility_data:
-        os.makedirs(output_dir, exist_ok=True)
-        with open(compatibility_output_file, 'w', encoding='utf-8') as f:
-            json.dump(compatibility_data, f, ensure_ascii=False, indent=4)
+        with metrics.stage("json_write"):
+            write_json(compatibility_output_file, compatibility_data)
         output_handler.log(f"Совместимость для {len(compatibility_data)} принтеров сохранена в '{compatibility_output_file}'.")
     else:
         output_handler.log("Не удалось собрать данные о совместимости")
+    metrics.finish(output_handler, metrics_dir)
+    return bool(compatibility_data) and not cancel_flag.is_cancelled() and metrics.succeeded(max_item_error_share)
 
 def filter_compatibility_by_stock(output_handler, cancel_flag):
-    """Фильтрация совместимости по товарам в наличии"""
+    """Фильтрация совместимости по товарам в наличии; True - результат сохранен"""
     if not os.path.exists(compatibility_output_file):
         output_handler.log(f"Файл {compatibility_output_file} не найден")
-        return
+        return False
     if not os.path.exists(xls_output_file):
         output_handler.log(f"Файл {xls_output_file} не найден")
-        return
+        return False
 
     try:
         with open(compatibility_output_file, 'r', encoding='utf-8') as f:
             compatibility_data = json.load(f)
     except Exception as e:
         output_handler.log(f"Ошибка при чтении файла {compatibility_output_file}: {e}")
-        return
+        return False
 
     try:
         with open(xls_output_file, 'r', encoding='utf-8') as f:
             stock_ids = set(json.load(f))
     except Exception as e:
         output_handler.log(f"Ошибка при чтении файла {xls_output_file}: {e}")
-        return
+        return False
 
     if not compatibility_data:
         output_handler.log("Данные о совместимости пусты")
-        return
+        return False
 
     filtered_data = {}
     total = len(compatibility_data)
@@ -311,7 +631,7 @@ def filter_compatibility_by_stock(output_handler, cancel_flag):
     for printer_id in compatibility_data.keys():
         if cancel_flag.is_cancelled():
             output_handler.log("Операция отменена")
-            return
+            return False
         current += 1
         output_handler.progress(current, total)
         data = compatibility_data[printer_id]
@@ -328,193 +648,466 @@ def filter_compatibility_by_stock(output_handler, cancel_flag):
             output_handler.log(f"Принтер {printer_id}: удален, так как нет товаров в наличии")
 
     if filtered_data:
-        os.makedirs(output_dir, exist_ok=True)
-        with open(compatibility_actual_output_file, 'w', encoding='utf-8') as f:
-            json.dump(filtered_data, f, ensure_ascii=False, indent=4)
+        write_json(compatibility_actual_output_file, filtered_data)
         output_handler.log(f"Отфильтрованные данные для {len(filtered_data)} принтеров сохранены в '{compatibility_actual_output_file}'.")
-    else:
-        output_handler.log("Нет данных для сохранения после фильтрации")
+        return True
+    output_handler.log("Нет данных для сохранения после фильтрации")
+    return False
 
-def load_in_transit_data(output_handler):
-    """Чтение данных о товарах в пути из temp_price.xls"""
-    in_transit_data = {}
+def load_stock_data(output_handler):
+    """Чтение остатков из temp_price.xls: {ID: (наличие, в пути)}"""
+    stock_data = {}
     try:
-        if not os.path.exists("temp_price.xls"):
-            output_handler.log("Файл temp_price.xls не найден")
-            return in_transit_data
-
-        xls = pd.ExcelFile("temp_price.xls")
-        for sheet_name in xls.sheet_names:
-            df = pd.read_excel(xls, sheet_name=sheet_name, dtype=str)
-            # Проверяем наличие колонок 3 ("Код") и 6 ("В пути")
-            if len(df.columns) >= 6:
-                for _, row in df.iterrows():
-                    product_id = row.iloc[2]  # Колонка 3 (индекс 2)
-                    in_transit = row.iloc[5]  # Колонка 6 (индекс 5)
-                    if isinstance(product_id, str) and re.match(r'^\d{12}$', product_id):
-                        # Проверяем, является ли in_transit числом
-                        try:
-                            in_transit_value = int(float(in_transit)) if pd.notna(in_transit) else 0
-                        except (ValueError, TypeError):
-                            in_transit_value = 0
-                        in_transit_data[product_id] = in_transit_value
-        output_handler.log(f"Загружено {len(in_transit_data)} записей о товарах в пути")
-        return in_transit_data
+        if not os.path.exists(xls_file):
+            output_handler.log(f"Файл {xls_file} не найден")
+            return stock_data
+
+        # Колонки 3 ("Код"), 5 ("Наличие") и 6 ("В пути"); листы без них пропускаются
+        for _, (code, availability, in_transit) in iter_xls_rows(xls_file, columns=(2, 4, 5)):
+            product_id = xls_code(code)
+            if product_id:
+                stock_data[product_id] = (xls_count(availability), xls_count(in_transit))
+        output_handler.log(f"Загружено {len(stock_data)} записей об остатках")
+        return stock_data
     except Exception as e:
         output_handler.log(f"Ошибка при чтении temp_price.xls: {e}")
-        return in_transit_data
+        return stock_data
 
 def ensure_xls_file(session, headers, output_handler, cancel_flag):
-    """Проверяет наличие temp_price.xls и скачивает его, если отсутствует"""
-    if os.path.exists("temp_price.xls"):
-        output_handler.log("Файл temp_price.xls уже существует")
-        return True
-    output_handler.log("Файл temp_price.xls отсутствует, выполняется скачивание")
+    """Проверяет наличие и свежесть temp_price.xls и при необходимости скачивает его"""
+    if os.path.exists(xls_file):
+        meta = load_xls_meta()
+        age = time.time() - meta.get("checked_at", os.path.getmtime(xls_file))
+        if age < xls_max_age:
+            output_handler.log(f"Файл {xls_file} уже существует (проверен {age / 60:.0f} мин назад)")
+            return True
+        output_handler.log(f"Файл {xls_file} устарел, выполняется проверка обновления")
+    else:
+        output_handler.log(f"Файл {xls_file} отсутствует, выполняется скачивание")
     return download_xls_file(session, headers, output_handler, cancel_flag)
 
-def parse_cartridges_and_parts(session, headers, output_handler, cancel_flag):
-    """Парсинг данных о актуальных картриджах и запчастях из PRINTERS_compatibility_actual.json"""
-    if not os.path.exists(compatibility_actual_output_file):
-        output_handler.log(f"Файл {compatibility_actual_output_file} не найден")
-        return
-
-    try:
-        with open(compatibility_actual_output_file, 'r', encoding='utf-8') as f:
-            compatibility_data = json.load(f)
-    except Exception as e:
-        output_handler.log(f"Ошибка при чтении файла {compatibility_actual_output_file}: {e}")
-        return
-
-    if not compatibility_data:
-        output_handler.log("Данные о совместимости пусты")
-        return
-
-    # Собираем все уникальные ID картриджей и запчастей
-    all_ids = set()
-    for printer_id, data in compatibility_data.items():
-        all_ids.update(data.get("cartridges", []))
-        all_ids.update(data.get("parts", []))
-
-    if not all_ids:
-        output_handler.log("Нет ID картриджей или запчастей для парсинга")
-        return
-
-    output_handler.log(f"Найдено {len(all_ids)} уникальных ID для парсинга")
+def parse_product_page(soup, product_id, in_transit_data, output_handler):
+    """Извлечение данных товара со страницы /Store/Details/{ID}"""
+    # Извлечение наименования товара
+    name_element = soup.select_one('div.grid-body.text-left.space-top-tiny h1')
+    product_name = name_element.text.strip() if name_element else ""
+
+    # Извлечение наличия
+    availability_element = soup.select_one('span.product-count')
+    availability = int(availability_element.text.strip()) if availability_element and availability_element.text.strip().isdigit() else 0
+
+    # Извлечение данных о товарах в пути
+    in_transit = in_transit_data.get(product_id, 0)
+
+    # Извлечение цен
+    price_element = soup.select_one('div.product-price-container span[data-bind*="getBrowsingPrice"]')
+    retail_price = 0.0
+    wholesale_price = 0.0
+    if price_element:
+        data_bind = price_element.get('data-bind', '')
+        match = re.search(r'getBrowsingPrice\((\d+\.\d+), (\d+\.?\d*)\)', data_bind)
+        if match:
+            retail_price = float(match.group(1))
+            wholesale_price = float(match.group(2))
+        else:
+            output_handler.log(f"Не удалось извлечь цены для ID {product_id}: {data_bind}")
+
+    # Извлечение характеристик
+    characteristics = {}
+    characteristics_table = soup.select_one('div.product-properties-container table.price-list')
+    if characteristics_table:
+        for row in characteristics_table.select('tr'):
+            cells = row.select('td')
+            if len(cells) == 2:
+                key = cells[0].text.strip()
+                value = cells[1].text.strip()
+                characteristics[key] = value
+
+    # Извлечение описания товара
+    description_section = soup.select_one('div.grid.space-top div.grid-body.text-left.space-top-tiny')
+    description = ""
+    if description_section:
+        description = ' '.join(description_section.get_text(strip=True).split())
+        description = re.sub(r'\s+', ' ', description).strip()
+
+    return {
+        "name": product_name,
+        "availability": availability,
+        "in_transit": in_transit,
+        "wholesale_price": wholesale_price,
+        "retail_price": retail_price,
+        "characteristics": characteristics,
+        "description": description
+    }
 
+def fetch_product(session, headers, product_id, in_transit_data, output_handler, metrics, fingerprints=None):
+    """Загрузка и разбор страницы одного товара
+
+    Если передано хранилище отпечатков и страница не изменилась с прошлого раза,
+    запись берется из него без разбора (обновляется только "В пути" из прайс-листа).
+    """
+    from bs4 import BeautifulSoup
+    url = f'{base_url}/Store/Details/{product_id}'
+    response = metrics.get(session, url, headers=headers, timeout=10, verify=cert_path)
+    response.raise_for_status()
+    if fingerprints is not None:
+        digest = page_digest(response.content, "product")
+        record = fingerprints.lookup(url, digest)
+        if record is not None:
+            metrics.count("page_unchanged")
+            record["in_transit"] = in_transit_data.get(product_id, 0)
+            return record
+        metrics.count("page_changed")
+    with metrics.stage("html_parse"):
+        soup = BeautifulSoup(response.text, 'html.parser')
+    with metrics.stage("extract"):
+        record = parse_product_page(soup, product_id, in_transit_data, output_handler)
+    if fingerprints is not None:
+        fingerprints.store(url, digest, record)
+    return record
+
+def load_stock_for_crawl(session, headers, output_handler, cancel_flag):
+    """Остатки для парсинга товаров (с проверкой свежести прайс-листа)"""
     # Проверяем и скачиваем temp_price.xls, если он отсутствует
     if not ensure_xls_file(session, headers, output_handler, cancel_flag):
         output_handler.log("Не удалось скачать temp_price.xls, данные 'in_transit' не будут загружены")
-        in_transit_data = {}
-    else:
-        # Загружаем данные о товарах в пути
-        in_transit_data = load_in_transit_data(output_handler)
+        return {}
+    return load_stock_data(output_handler)
+
+def order_crawl_queue(product_ids, stock_data, output_handler):
+    """Порядок обхода: товары с остатком, совместимые со многими принтерами и давно не обновлявшиеся - первыми"""
+    ordered = prioritize(product_ids, stock_data, compatibility_degree(compatibility_output_file), load_fetch_times(fetch_times_file))
+    if ordered:
+        output_handler.log(f"Очередь упорядочена по приоритету, первые ID: {', '.join(ordered[:5])}")
+    return ordered
+
+def crawl_time_budget():
+    """Ограничение времени парсинга в секундах (COMCENTER_CRAWL_BUDGET в .env), None - без ограничения"""
+    try:
+        budget = float(os.getenv("COMCENTER_CRAWL_BUDGET", ""))
+    except ValueError:
+        return None
+    return budget if budget > 0 else None
+
+def parse_products(product_ids, output_file, metrics_name, session, headers, output_handler, cancel_flag, time_budget=None):
+    """Общий цикл парсинга страниц товаров с сохранением в output_file
+
+    Товары обходятся по приоритету; при ограничении time_budget (в секундах) парсинг
+    останавливается по его истечении, а необновленные товары берутся из существующего файла.
+    Возвращает True, если запуск не отменен и доля ошибок не больше max_item_error_share.
+    """
+    stock_data = load_stock_for_crawl(session, headers, output_handler, cancel_flag)
+    in_transit_data = {product_id: in_transit for product_id, (_, in_transit) in stock_data.items()}
+    product_ids = order_crawl_queue(product_ids, stock_data, output_handler)
+    time_budget = time_budget or crawl_time_budget()
+    deadline = time.monotonic() + time_budget if time_budget else None
+    budget_exhausted = False
 
     # Словарь для хранения данных
     parsed_data = {}
-    total = len(all_ids)
+    total = len(product_ids)
     current = 0
+    metrics = RunMetrics(metrics_name)
+    fingerprints = FingerprintStore(fingerprints_file)
 
-    for product_id in all_ids:
+    for product_id in product_ids:
         if cancel_flag.is_cancelled():
-            output_handler.log("Операция отменена")
-            return
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            budget_exhausted = True
+            break
         current += 1
         output_handler.progress(current, total)
-        url = f'https://comcenter.ru/Store/Details/{product_id}'
         output_handler.log(f"Обрабатывается ID: {product_id}")
 
         try:
-            response = session.get(url, headers=headers, timeout=10, verify=cert_path)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Извлечение наименования товара
-            name_element = soup.select_one('div.grid-body.text-left.space-top-tiny h1')
-            product_name = name_element.text.strip() if name_element else ""
-
-            # Извлечение наличия
-            availability_element = soup.select_one('span.product-count')
-            availability = int(availability_element.text.strip()) if availability_element and availability_element.text.strip().isdigit() else 0
-
-            # Извлечение данных о товарах в пути
-            in_transit = in_transit_data.get(product_id, 0)
-
-            # Извлечение цен
-            price_element = soup.select_one('div.product-price-container span[data-bind*="getBrowsingPrice"]')
-            retail_price = 0.0
-            wholesale_price = 0.0
-            if price_element:
-                data_bind = price_element.get('data-bind', '')
-                match = re.search(r'getBrowsingPrice\((\d+\.\d+), (\d+\.?\d*)\)', data_bind)
-                if match:
-                    retail_price = float(match.group(1))
-                    wholesale_price = float(match.group(2))
-                else:
-                    output_handler.log(f"Не удалось извлечь цены для ID {product_id}: {data_bind}")
-
-            # Извлечение характеристик
-            characteristics = {}
-            characteristics_table = soup.select_one('div.product-properties-container table.price-list')
-            if characteristics_table:
-                for row in characteristics_table.select('tr'):
-                    cells = row.select('td')
-                    if len(cells) == 2:
-                        key = cells[0].text.strip()
-                        value = cells[1].text.strip()
-                        characteristics[key] = value
-
-            # Извлечение описания товара
-            description_section = soup.select_one('div.grid.space-top div.grid-body.text-left.space-top-tiny')
-            description = ""
-            if description_section:
-                description = ' '.join(description_section.get_text(strip=True).split())
-                description = re.sub(r'\s+', ' ', description).strip()
-
-            # Формирование данных для текущего ID
-            parsed_data[product_id] = {
-                "name": product_name,
-                "availability": availability,
-                "in_transit": in_transit,
-                "wholesale_price": wholesale_price,
-                "retail_price": retail_price,
-                "characteristics": characteristics,
-                "description": description
-            }
-
+            parsed_data[product_id] = cancel_flag.call(
+                fetch_product, session, headers, product_id, in_transit_data, output_handler, metrics, fingerprints
+            )
+            metrics.item_done()
             output_handler.log(f"ID {product_id}: успешно обработан")
 
+        except OperationCancelled:
+            break
         except requests.exceptions.RequestException as e:
+            metrics.item_done(ok=False)
             output_handler.log(f"Ошибка при загрузке страницы для ID {product_id}: {e}")
             continue
         except Exception as e:
+            metrics.item_done(ok=False)
             output_handler.log(f"Ошибка при парсинге данных для ID {product_id}: {e}")
             continue
 
-    # Сохранение данных в JSON
+    fingerprints.report(output_handler)
+    fingerprints.close()
+    fetched = list(parsed_data)
+    record_fetch_times(fetched, fetch_times_file)
+    if cancel_flag.is_cancelled():
+        output_handler.log(f"Операция отменена, сохраняются результаты для {len(parsed_data)} обработанных товаров")
+        parsed_data = merge_with_existing(parsed_data, output_file, output_handler)
+    elif budget_exhausted:
+        output_handler.log(
+            f"Время парсинга ({time_budget:.0f} с) истекло: обновлено {len(parsed_data)} из {total} товаров, "
+            f"остальные берутся из '{output_file}'"
+        )
+        parsed_data = merge_with_existing(parsed_data, output_file, output_handler)
+
+    save_parsed_products(parsed_data, output_file, output_handler, metrics, fetched)
+    metrics.finish(output_handler, metrics_dir)
+    return bool(parsed_data) and not cancel_flag.is_cancelled() and metrics.succeeded(max_item_error_share)
+
+def save_parsed_products(parsed_data, output_file, output_handler, metrics, fetched_ids=None):
+    """Сохранение базы товаров в JSON, запись истории и обновление поискового индекса
+
+    fetched_ids - ID товаров, действительно полученных с сайта в этом запуске (None - все).
+    В историю попадают только они: записи, взятые из существующего файла, не являются
+    наблюдением и дали бы ложные изменения.
+    """
     if parsed_data:
-        os.makedirs(output_dir, exist_ok=True)
-        with open(cartridges_parts_output_file, 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
-        output_handler.log(f"Данные для {len(parsed_data)} элементов сохранены в '{cartridges_parts_output_file}'.")
+        with metrics.stage("json_write"):
+            write_json(output_file, parsed_data)
+        output_handler.log(f"Данные для {len(parsed_data)} элементов сохранены в '{output_file}'.")
+        if fetched_ids is not None:
+            observed = {product_id: parsed_data[product_id] for product_id in fetched_ids if product_id in parsed_data}
+        else:
+            observed = parsed_data
+        if observed:
+            record_snapshot(observed, os.path.basename(output_file), output_handler, history_file)
+        build_search_index(search_index_sources, search_index_file, output_handler)
     else:
         output_handler.log("Не удалось собрать данные")
 
-def parse_all_cartridges_and_parts(session, headers, output_handler, cancel_flag):
-    """Парсинг данных о ВСЕХ картриджах и запчастях из PRINTERS_compatibility.json"""
-    if not os.path.exists(compatibility_output_file):
-        output_handler.log(f"Файл {compatibility_output_file} не найден")
-        return
+def find_class_tag(body, start, tag, class_name):
+    """Первый открывающий тег <tag class="... class_name ..."> не раньше позиции start
+
+    Возвращает ((начало, конец тега), позиция) или (None, позиция, с которой продолжить
+    поиск после дочитывания страницы).
+    """
+    pos = body.find(class_name, start)
+    while pos != -1:
+        tag_start = body.rfind(b'<', 0, pos)
+        # Вхождение в тексте или скриптах, а не внутри открывающего тега
+        if tag_start == -1 or body.find(b'>', tag_start, pos) != -1:
+            pos = body.find(class_name, pos + 1)
+            continue
+        tag_end = body.find(b'>', pos)
+        if tag_end == -1:
+            return None, pos
+        match = class_tag_re.match(body, tag_start, tag_end + 1)
+        if not match or match.group(1).lower() != tag or class_name not in match.group(2).split():
+            pos = body.find(class_name, tag_end)
+            continue
+        return (tag_start, tag_end + 1), pos
+    return None, max(len(body) - len(class_name) + 1, start)
+
+def find_product_count(body, start):
+    """Наличие из первого элемента span.product-count
+
+    Возвращает (значение, позиция): значение - число (0, если текст не числовой),
+    None, если элемент еще не дочитан (поиск продолжается с позиции), или False,
+    если текст элемента содержит вложенную разметку и нужен полный разбор.
+    """
+    found, pos = find_class_tag(body, start, b'span', product_count_marker)
+    if found is None:
+        return None, pos
+    tag_end = found[1]
+    text_end = body.find(b'<', tag_end)
+    if text_end == -1 or len(body) < text_end + 7:
+        return None, pos
+    if body[text_end:text_end + 7] != b'</span>':
+        return False, pos
+    text = body[tag_end:text_end].strip()
+    return (int(text) if text.isdigit() else 0), pos
+
+class FastPriceScanner:
+    """Поиск наличия и цен в теле страницы по мере его загрузки
+
+    feed вызывается после каждого фрагмента с накопленным телом; каждый фрагмент
+    просматривается один раз (позиции поиска сохраняются между вызовами). Цены ищутся
+    только внутри первого div.product-price-container: его конец определяется
+    подсчетом вложенных div.
+    """
+    def __init__(self):
+        self.availability = None
+        self.count_from = 0
+        self.prices = None
+        self.container_from = 0
+        self.content_start = None
+        self.scan_from = 0
+        self.depth = 1
+
+    def find_prices(self, body):
+        """(розничная, оптовая) цены, None - нужно дочитать, False - нужен полный разбор"""
+        if self.content_start is None:
+            found, self.container_from = find_class_tag(body, self.container_from, b'div', price_container_marker)
+            if found is None:
+                return None
+            self.content_start = self.scan_from = found[1]
+        for match in div_tag_re.finditer(body, self.scan_from):
+            self.scan_from = match.end()
+            self.depth += -1 if match.group(1) else 1
+            if self.depth == 0:
+                span = price_span_re.search(body, self.content_start, match.start())
+                price_match = browsing_price_re.search(span.group(1)) if span else None
+                if not price_match:
+                    return False
+                return float(price_match.group(1)), float(price_match.group(2))
+        # Недописанный тег в конце тела будет найден после следующего фрагмента
+        self.scan_from = max(self.scan_from, len(body) - 5)
+        return None
 
+    def feed(self, body):
+        """Словарь availability/retail_price/wholesale_price, None - нужно дочитать, False - нужен полный разбор"""
+        if self.availability is None:
+            self.availability, self.count_from = find_product_count(body, self.count_from)
+        if self.prices is None:
+            self.prices = self.find_prices(body)
+        if self.availability is False or self.prices is False:
+            return False
+        if self.availability is None or self.prices is None:
+            return None
+        return {
+            "availability": self.availability,
+            "retail_price": self.prices[0],
+            "wholesale_price": self.prices[1],
+        }
+
+def fetch_prices_fast(session, url, headers, metrics):
+    """Потоковое чтение страницы товара до появления наличия и цен
+
+    Возвращает (данные, тело): данные - словарь availability/retail_price/wholesale_price
+    или None, если поля не найдены; во втором случае тело содержит страницу целиком.
+    """
+    start = time.perf_counter()
+    response = session.get(url, headers=headers, timeout=10, verify=cert_path, stream=True)
+    metrics.record("ttfb", time.perf_counter() - start)
     try:
-        with open(compatibility_output_file, 'r', encoding='utf-8') as f:
+        response.raise_for_status()
+        body = bytearray()
+        data = None
+        scanner = FastPriceScanner()
+        download_start = time.perf_counter()
+        for chunk in response.iter_content(chunk_size=fast_path_chunk_size):
+            body += chunk
+            # False - быстрый способ не подходит, страница дочитывается для полного разбора
+            if data is not False:
+                data = scanner.feed(body)
+                if data:
+                    break
+        data = data or None
+        if data:
+            # Небольшой остаток дочитываем, чтобы соединение вернулось в пул;
+            # большой дешевле оборвать, чем скачивать. Content-Length - размер на проводе
+            # (при gzip - сжатый), поэтому сравнивается с прочитанным из сокета, а не с телом
+            remaining = int(response.headers.get("Content-Length", 0)) - response.raw.tell()
+            if 0 < remaining <= fast_path_drain_limit:
+                for _ in response.iter_content(chunk_size=fast_path_chunk_size):
+                    pass
+        metrics.record("download", time.perf_counter() - download_start)
+        metrics.bytes_downloaded += len(body)
+        return data, bytes(body)
+    finally:
+        response.close()
+
+def refresh_prices(session, headers, output_handler, cancel_flag, database_file=comcenter_products_output_file, time_budget=None):
+    """Быстрое обновление только цен и наличия в ранее спарсенной базе товаров
+
+    Наименование, характеристики и описание берутся из базы. Если на странице не
+    удалось найти наличие и цены быстрым способом, страница разбирается полностью.
+    Товары обходятся по приоритету, как в parse_products. Результат - как у parse_products.
+    """
+    from bs4 import BeautifulSoup
+    if not os.path.exists(database_file):
+        output_handler.log(f"Файл {database_file} не найден")
+        return False
+
+    try:
+        with open(database_file, 'r', encoding='utf-8') as f:
+            parsed_data = json.load(f)
+    except Exception as e:
+        output_handler.log(f"Ошибка при чтении файла {database_file}: {e}")
+        return False
+
+    if not parsed_data:
+        output_handler.log("База товаров пуста")
+        return False
+
+    output_handler.log(f"Обновление цен и наличия для {len(parsed_data)} товаров")
+    stock_data = load_stock_for_crawl(session, headers, output_handler, cancel_flag)
+    in_transit_data = {product_id: in_transit for product_id, (_, in_transit) in stock_data.items()}
+    product_ids = order_crawl_queue(parsed_data, stock_data, output_handler)
+    time_budget = time_budget or crawl_time_budget()
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    total = len(parsed_data)
+    current = 0
+    fast_hits = 0
+    fallbacks = 0
+    refreshed = []
+    metrics = RunMetrics("refresh_prices")
+
+    for product_id in product_ids:
+        if cancel_flag.is_cancelled():
+            output_handler.log("Операция отменена, сохраняются уже обновленные цены")
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            output_handler.log(f"Время обновления ({time_budget:.0f} с) истекло, сохраняются уже обновленные цены")
+            break
+        current += 1
+        output_handler.progress(current, total)
+        url = f'{base_url}/Store/Details/{product_id}'
+
+        try:
+            with metrics.stage("request"):
+                data, body = cancel_flag.call(fetch_prices_fast, session, url, headers, metrics)
+            if data:
+                fast_hits += 1
+                data["in_transit"] = in_transit_data.get(product_id, 0)
+                parsed_data[product_id].update(data)
+            else:
+                # Быстрый способ не сработал - полный разбор страницы
+                fallbacks += 1
+                with metrics.stage("html_parse"):
+                    soup = BeautifulSoup(body, 'html.parser')
+                with metrics.stage("extract"):
+                    parsed_data[product_id] = parse_product_page(soup, product_id, in_transit_data, output_handler)
+            refreshed.append(product_id)
+            metrics.item_done()
+
+        except OperationCancelled:
+            output_handler.log("Операция отменена, сохраняются уже обновленные цены")
+            break
+        except requests.exceptions.RequestException as e:
+            metrics.item_done(ok=False)
+            output_handler.log(f"Ошибка при загрузке страницы для ID {product_id}: {e}")
+            continue
+        except Exception as e:
+            metrics.item_done(ok=False)
+            output_handler.log(f"Ошибка при парсинге данных для ID {product_id}: {e}")
+            continue
+
+    output_handler.log(f"Цены обновлены: быстрым способом {fast_hits}, полным разбором {fallbacks}")
+    record_fetch_times(refreshed, fetch_times_file)
+    save_parsed_products(parsed_data, database_file, output_handler, metrics, refreshed)
+    metrics.finish(output_handler, metrics_dir)
+    return not cancel_flag.is_cancelled() and metrics.succeeded(max_item_error_share)
+
+def collect_compatible_ids(compatibility_file, output_handler):
+    """Все уникальные ID картриджей и запчастей из файла совместимости"""
+    if not os.path.exists(compatibility_file):
+        output_handler.log(f"Файл {compatibility_file} не найден")
+        return None
+
+    try:
+        with open(compatibility_file, 'r', encoding='utf-8') as f:
             compatibility_data = json.load(f)
     except Exception as e:
-        output_handler.log(f"Ошибка при чтении файла {compatibility_output_file}: {e}")
-        return
+        output_handler.log(f"Ошибка при чтении файла {compatibility_file}: {e}")
+        return None
 
     if not compatibility_data:
         output_handler.log("Данные о совместимости пусты")
-        return
+        return None
 
     # Собираем все уникальные ID картриджей и запчастей
     all_ids = set()
@@ -524,264 +1117,118 @@ def parse_all_cartridges_and_parts(session, headers, output_handler, cancel_flag
 
     if not all_ids:
         output_handler.log("Нет ID картриджей или запчастей для парсинга")
-        return
+        return None
 
     output_handler.log(f"Найдено {len(all_ids)} уникальных ID для парсинга")
+    return all_ids
 
-    # Проверяем и скачиваем temp_price.xls, если он отсутствует
-    if not ensure_xls_file(session, headers, output_handler, cancel_flag):
-        output_handler.log("Не удалось скачать temp_price.xls, данные 'in_transit' не будут загружены")
-        in_transit_data = {}
-    else:
-        # Загружаем данные о товарах в пути
-        in_transit_data = load_in_transit_data(output_handler)
-
-    # Словарь для хранения данных
-    parsed_data = {}
-    total = len(all_ids)
-    current = 0
-
-    for product_id in all_ids:
-        if cancel_flag.is_cancelled():
-            output_handler.log("Операция отменена")
-            return
-        current += 1
-        output_handler.progress(current, total)
-        url = f'https://comcenter.ru/Store/Details/{product_id}'
-        output_handler.log(f"Обрабатывается ID: {product_id}")
-
-        try:
-            response = session.get(url, headers=headers, timeout=10, verify=cert_path)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Извлечение наименования товара
-            name_element = soup.select_one('div.grid-body.text-left.space-top-tiny h1')
-            product_name = name_element.text.strip() if name_element else ""
-
-            # Извлечение наличия
-            availability_element = soup.select_one('span.product-count')
-            availability = int(availability_element.text.strip()) if availability_element and availability_element.text.strip().isdigit() else 0
-
-            # Извлечение данных о товарах в пути
-            in_transit = in_transit_data.get(product_id, 0)
-
-            # Извлечение цен
-            price_element = soup.select_one('div.product-price-container span[data-bind*="getBrowsingPrice"]')
-            retail_price = 0.0
-            wholesale_price = 0.0
-            if price_element:
-                data_bind = price_element.get('data-bind', '')
-                match = re.search(r'getBrowsingPrice\((\d+\.\d+), (\d+\.?\d*)\)', data_bind)
-                if match:
-                    retail_price = float(match.group(1))
-                    wholesale_price = float(match.group(2))
-                else:
-                    output_handler.log(f"Не удалось извлечь цены для ID {product_id}: {data_bind}")
-
-            # Извлечение характеристик
-            characteristics = {}
-            characteristics_table = soup.select_one('div.product-properties-container table.price-list')
-            if characteristics_table:
-                for row in characteristics_table.select('tr'):
-                    cells = row.select('td')
-                    if len(cells) == 2:
-                        key = cells[0].text.strip()
-                        value = cells[1].text.strip()
-                        characteristics[key] = value
-
-            # Извлечение описания товара
-            description_section = soup.select_one('div.grid.space-top div.grid-body.text-left.space-top-tiny')
-            description = ""
-            if description_section:
-                description = ' '.join(description_section.get_text(strip=True).split())
-                description = re.sub(r'\s+', ' ', description).strip()
-
-            # Формирование данных для текущего ID
-            parsed_data[product_id] = {
-                "name": product_name,
-                "availability": availability,
-                "in_transit": in_transit,
-                "wholesale_price": wholesale_price,
-                "retail_price": retail_price,
-                "characteristics": characteristics,
-                "description": description
-            }
+def parse_cartridges_and_parts(session, headers, output_handler, cancel_flag):
+    """Парсинг данных о актуальных картриджах и запчастях из PRINTERS_compatibility_actual.json"""
+    all_ids = collect_compatible_ids(compatibility_actual_output_file, output_handler)
+    if not all_ids:
+        return False
 
-            output_handler.log(f"ID {product_id}: успешно обработан")
+    return parse_products(all_ids, cartridges_parts_output_file, "parse_cartridges_and_parts", session, headers, output_handler, cancel_flag)
 
-        except requests.exceptions.RequestException as e:
-            output_handler.log(f"Ошибка при загрузке страницы для ID {product_id}: {e}")
-            continue
-        except Exception as e:
-            output_handler.log(f"Ошибка при парсинге данных для ID {product_id}: {e}")
-            continue
+def parse_all_cartridges_and_parts(session, headers, output_handler, cancel_flag):
+    """Парсинг данных о ВСЕХ картриджах и запчастях из PRINTERS_compatibility.json"""
+    all_ids = collect_compatible_ids(compatibility_output_file, output_handler)
+    if not all_ids:
+        return False
 
-    # Сохранение данных в JSON
-    if parsed_data:
-        os.makedirs(output_dir, exist_ok=True)
-        with open(all_cartridges_parts_output_file, 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
-        output_handler.log(f"Данные для {len(parsed_data)} элементов сохранены в '{all_cartridges_parts_output_file}'.")
-    else:
-        output_handler.log("Не удалось собрать данные")
+    return parse_products(all_ids, all_cartridges_parts_output_file, "parse_all_cartridges_and_parts", session, headers, output_handler, cancel_flag)
 
-def parse_comcenter_products(session, headers, output_handler, cancel_flag):
-    """Парсинг данных о актуальных товарах Comcenter из DATABASE_recent.json"""
+def load_recent_ids(output_handler):
+    """ID актуальных товаров из DATABASE_recent.json"""
     if not os.path.exists(xls_output_file):
         output_handler.log(f"Файл {xls_output_file} не найден")
-        return
+        return None
 
     try:
         with open(xls_output_file, 'r', encoding='utf-8') as f:
             product_ids = json.load(f)
     except Exception as e:
         output_handler.log(f"Ошибка при чтении файла {xls_output_file}: {e}")
-        return
+        return None
 
     if not product_ids:
         output_handler.log("Список ID товаров пуст")
-        return
+        return None
 
     output_handler.log(f"Найдено {len(product_ids)} уникальных ID для парсинга")
+    return product_ids
 
-    # Проверяем и скачиваем temp_price.xls, если он отсутствует
-    if not ensure_xls_file(session, headers, output_handler, cancel_flag):
-        output_handler.log("Не удалось скачать temp_price.xls, данные 'in_transit' не будут загружены")
-        in_transit_data = {}
-    else:
-        # Загружаем данные о товарах в пути
-        in_transit_data = load_in_transit_data(output_handler)
-
-    # Словарь для хранения данных
-    parsed_data = {}
-    total = len(product_ids)
-    current = 0
-
-    for product_id in product_ids:
-        if cancel_flag.is_cancelled():
-            output_handler.log("Операция отменена")
-            return
-        current += 1
-        output_handler.progress(current, total)
-        url = f'https://comcenter.ru/Store/Details/{product_id}'
-        output_handler.log(f"Обрабатывается ID: {product_id}")
-
-        try:
-            response = session.get(url, headers=headers, timeout=10, verify=cert_path)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Извлечение наименования товара
-            name_element = soup.select_one('div.grid-body.text-left.space-top-tiny h1')
-            product_name = name_element.text.strip() if name_element else ""
-
-            # Извлечение наличия
-            availability_element = soup.select_one('span.product-count')
-            availability = int(availability_element.text.strip()) if availability_element and availability_element.text.strip().isdigit() else 0
-
-            # Извлечение данных о товарах в пути
-            in_transit = in_transit_data.get(product_id, 0)
-
-            # Извлечение цен
-            price_element = soup.select_one('div.product-price-container span[data-bind*="getBrowsingPrice"]')
-            retail_price = 0.0
-            wholesale_price = 0.0
-            if price_element:
-                data_bind = price_element.get('data-bind', '')
-                match = re.search(r'getBrowsingPrice\((\d+\.\d+), (\d+\.?\d*)\)', data_bind)
-                if match:
-                    retail_price = float(match.group(1))
-                    wholesale_price = float(match.group(2))
-                else:
-                    output_handler.log(f"Не удалось извлечь цены для ID {product_id}: {data_bind}")
-
-            # Извлечение характеристик
-            characteristics = {}
-            characteristics_table = soup.select_one('div.product-properties-container table.price-list')
-            if characteristics_table:
-                for row in characteristics_table.select('tr'):
-                    cells = row.select('td')
-                    if len(cells) == 2:
-                        key = cells[0].text.strip()
-                        value = cells[1].text.strip()
-                        characteristics[key] = value
-
-            # Извлечение описания товара
-            description_section = soup.select_one('div.grid.space-top div.grid-body.text-left.space-top-tiny')
-            description = ""
-            if description_section:
-                description = ' '.join(description_section.get_text(strip=True).split())
-                description = re.sub(r'\s+', ' ', description).strip()
-
-            # Формирование данных для текущего ID
-            parsed_data[product_id] = {
-                "name": product_name,
-                "availability": availability,
-                "in_transit": in_transit,
-                "wholesale_price": wholesale_price,
-                "retail_price": retail_price,
-                "characteristics": characteristics,
-                "description": description
-            }
-
-            output_handler.log(f"ID {product_id}: успешно обработан")
-
-        except requests.exceptions.RequestException as e:
-            output_handler.log(f"Ошибка при загрузке страницы для ID {product_id}: {e}")
-            continue
-        except Exception as e:
-            output_handler.log(f"Ошибка при парсинге данных для ID {product_id}: {e}")
-            continue
+def parse_comcenter_products(session, headers, output_handler, cancel_flag):
+    """Парсинг данных о актуальных товарах Comcenter из DATABASE_recent.json"""
+    product_ids = load_recent_ids(output_handler)
+    if not product_ids:
+        return False
 
-    # Сохранение данных в JSON
-    if parsed_data:
-        os.makedirs(output_dir, exist_ok=True)
-        with open(comcenter_products_output_file, 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
-        output_handler.log(f"Данные для {len(parsed_data)} элементов сохранены в '{comcenter_products_output_file}'.")
-    else:
-        output_handler.log("Не удалось собрать данные")
+    return parse_products(product_ids, comcenter_products_output_file, "parse_comcenter_products", session, headers, output_handler, cancel_flag)
 
 def run_action(choice, output_handler, cancel_flag):
-    """Запуск выбранного действия"""
+    """Запуск выбранного действия; True - действие выполнено"""
     session_info = setup_session(output_handler)
     if not session_info:
         output_handler.log("Не удалось авторизоваться. Программа завершена.")
-        return
+        return False
 
     session, headers = session_info
+    return perform_action(choice, session, headers, output_handler, cancel_flag)
 
+def perform_action(choice, session, headers, output_handler, cancel_flag):
+    """Выполнение действия в уже авторизованной сессии
+
+    Возвращает True, если действие выполнено: ошибки этапов записываются в лог и не
+    пробрасываются, поэтому вызывающий код (фоновый режим) судит об успехе по результату.
+    """
     if choice == "1":
         output_handler.log("Получение базы данных лазерных принтеров...")
-        get_laser_printers_database(session, headers, output_handler, cancel_flag)
+        return get_laser_printers_database(session, headers, output_handler, cancel_flag)
     
     elif choice == "2":
         output_handler.log("Получение базы данных из xls-файла...")
-        process_xls_database(session, headers, output_handler, cancel_flag)
+        return process_xls_database(session, headers, output_handler, cancel_flag)
     
     elif choice == "3":
         output_handler.log("Парсинг совместимости для всех принтеров...")
-        parse_printer_compatibility(session, headers, output_handler, cancel_flag)
+        return parse_printer_compatibility(session, headers, output_handler, cancel_flag)
     
     elif choice == "4":
         output_handler.log("Фильтрация совместимости по товарам в наличии...")
-        filter_compatibility_by_stock(output_handler, cancel_flag)
+        return filter_compatibility_by_stock(output_handler, cancel_flag)
     
     elif choice == "5":
         output_handler.log("Парсинг актуальных картриджей и запчастей...")
-        parse_cartridges_and_parts(session, headers, output_handler, cancel_flag)
+        return parse_cartridges_and_parts(session, headers, output_handler, cancel_flag)
     
     elif choice == "6":
         output_handler.log("Парсинг ВСЕХ картриджей и запчастей...")
-        parse_all_cartridges_and_parts(session, headers, output_handler, cancel_flag)
+        return parse_all_cartridges_and_parts(session, headers, output_handler, cancel_flag)
     
     elif choice == "7":
         output_handler.log("Парсинг актуальных товаров Comcenter...")
-        parse_comcenter_products(session, headers, output_handler, cancel_flag)
+        return parse_comcenter_products(session, headers, output_handler, cancel_flag)
+    
+    elif choice == "8":
+        output_handler.log("Обновление цен и наличия товаров Comcenter...")
+        return refresh_prices(session, headers, output_handler, cancel_flag)
     
     else:
-        output_handler.log("Неверный выбор. Пожалуйста, выберите 0, 1, 2, 3, 4, 5, 6 или 7")
+        output_handler.log("Неверный выбор. Пожалуйста, выберите 0, 1, 2, 3, 4, 5, 6, 7 или 8")
+        return False
+
+def run_interruptible(target, args, output_handler, cancel_flag, message="Запрос на отмену операции отправлен..."):
+    """Выполнение target в отдельном потоке, чтобы Ctrl+C прерывал его через cancel_flag"""
+    worker = threading.Thread(target=target, args=args, daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.2)
+    except KeyboardInterrupt:
+        output_handler.log(message)
+        cancel_flag.cancel()
+        worker.join()
 
 def console_main():
     """Консольный интерфейс программы"""
@@ -796,16 +1243,17 @@ def console_main():
         print("5. Парсинг актуальных картриджей и запчастей")
         print("6. Парсинг ВСЕХ картриджей и запчастей")
         print("7. Парсинг актуальных товаров Comcenter")
+        print("8. Обновление цен и наличия товаров Comcenter")
         print("0. Выход")
         
-        choice = input("Выберите действие (0-7): ")
+        choice = input("Выберите действие (0-8): ")
         
         if choice == "0":
             output_handler.log("Программа завершена")
             break
         
         cancel_flag = CancelFlag()
-        run_action(choice, output_handler, cancel_flag)
+        run_interruptible(run_action, (choice, output_handler, cancel_flag), output_handler, cancel_flag)
 
 if __name__ == "__main__":
     console_main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+import math
+import os
+import time
+from collections import Counter
+
+from comcenter_jsonio import write_json
+
+# Приоритетная очередь парсинга: сначала обновляются товары, важные для продаж.
+# Вес товара складывается из трех частей:
+# - остаток: наличие и "В пути" по прайс-листу (логарифм, чтобы 100 шт. не затмевали все остальное);
+# - степень совместимости: число принтеров, с которыми совместим товар;
+# - устаревание: время с последнего успешного обновления (никогда не обновлявшиеся - максимум).
+# Если запуск ограничен по времени или прерван, важные данные уже обновлены
+
+stock_weight = 1.0
+degree_weight = 0.5
+staleness_weight = 2.0
+# Устаревание больше этого срока (в секундах) считается максимальным
+staleness_horizon = 7 * 24 * 60 * 60
+
+def load_fetch_times(path):
+    """Время последнего успешного обновления товаров: {ID: unix time}"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def record_fetch_times(product_ids, path, now=None):
+    """Отметка товаров как обновленных"""
+    if not product_ids:
+        return
+    now = time.time() if now is None else now
+    fetch_times = load_fetch_times(path)
+    fetch_times.update({product_id: round(now) for product_id in product_ids})
+    write_json(path, fetch_times, compact=True)
+
+def compatibility_degree(compatibility_file):
+    """Число принтеров, с которыми совместим каждый товар"""
+    degree = Counter()
+    if not os.path.exists(compatibility_file):
+        return degree
+    try:
+        with open(compatibility_file, 'r', encoding='utf-8') as f:
+            compatibility_data = json.load(f)
+    except Exception:
+        return degree
+    for data in compatibility_data.values():
+        degree.update(set(data.get("cartridges", [])) | set(data.get("parts", [])))
+    return degree
+
+def priority_score(product_id, stock, degree, fetch_times, now):
+    availability, in_transit = stock.get(product_id, (0, 0))
+    last_fetch = fetch_times.get(product_id)
+    staleness = 1.0 if last_fetch is None else min(max(now - last_fetch, 0) / staleness_horizon, 1.0)
+    return (
+        stock_weight * math.log1p(max(availability, 0) + max(in_transit, 0))
+        + degree_weight * math.log1p(degree.get(product_id, 0))
+        + staleness_weight * staleness
+    )
+
+def prioritize(product_ids, stock, degree, fetch_times, now=None):
+    """ID товаров по убыванию приоритета (при равенстве - по ID, чтобы порядок был стабильным)
+
+    stock - {ID: (наличие, в пути)}, degree - {ID: число принтеров}, fetch_times - {ID: unix time}.
+    """
+    now = time.time() if now is None else now
+    scores = {product_id: priority_score(product_id, stock, degree, fetch_times, now) for product_id in set(product_ids)}
+    return sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
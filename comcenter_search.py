@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import sqlite3
+import tempfile
+
+from comcenter_jsonio import file_mode, replace_file
+
+# Поисковый индекс по спарсенным товарам (путь задается в comcenter_parser.search_index_file).
+# Полнотекстовая часть - SQLite FTS5 (tokenize unicode61 корректно приводит регистр кириллицы),
+# атрибутная - таблица характеристик ключ/значение с индексом по ключу
+
+SCHEMA = """
+CREATE TABLE products (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    availability INTEGER,
+    in_transit INTEGER,
+    wholesale_price REAL,
+    retail_price REAL,
+    source TEXT
+);
+CREATE TABLE characteristics (
+    product_id TEXT,
+    key TEXT,
+    value TEXT
+);
+CREATE INDEX characteristics_key ON characteristics (key, value);
+CREATE VIRTUAL TABLE products_fts USING fts5(
+    id UNINDEXED,
+    name,
+    characteristics,
+    description,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+"""
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def build_search_index(sources, index_path, output_handler):
+    """Построение индекса по JSON-базам товаров
+
+    sources - список путей к базам в формате DATABASE_*.json. Если ID встречается
+    в нескольких базах, берется запись из более поздней в списке.
+    """
+    products = {}
+    for path in sources:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            output_handler.log(f"Ошибка при чтении файла {path}: {e}")
+            continue
+        source = os.path.basename(path)
+        for product_id, record in data.items():
+            products[product_id] = (record, source)
+
+    if not products:
+        output_handler.log("Нет данных для построения поискового индекса")
+        return False
+
+    # Индекс строится во временном файле с уникальным именем (индекс могут перестраивать
+    # одновременно GUI, фоновый режим и слияние распределенного задания) и подменяет старый целиком
+    tmp_path = None
+    try:
+        directory = os.path.dirname(os.path.abspath(index_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(index_path) + ".", suffix=".tmp", dir=directory)
+        os.close(fd)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+                for product_id, (record, source) in products.items():
+                    characteristics = record.get("characteristics", {})
+                    conn.execute(
+                        "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (product_id, record.get("name", ""), record.get("availability", 0),
+                         record.get("in_transit", 0), record.get("wholesale_price", 0.0),
+                         record.get("retail_price", 0.0), source)
+                    )
+                    conn.executemany(
+                        "INSERT INTO characteristics VALUES (?, ?, ?)",
+                        [(product_id, key, value) for key, value in characteristics.items()]
+                    )
+                    conn.execute(
+                        "INSERT INTO products_fts VALUES (?, ?, ?, ?)",
+                        (product_id, record.get("name", ""),
+                         " ".join(f"{key}: {value}" for key, value in characteristics.items()),
+                         record.get("description", ""))
+                    )
+                conn.execute("INSERT INTO products_fts(products_fts) VALUES ('optimize')")
+        finally:
+            conn.close()
+        os.chmod(tmp_path, file_mode(index_path))
+        replace_file(tmp_path, index_path)
+        output_handler.log(f"Поисковый индекс для {len(products)} товаров сохранен в '{index_path}'.")
+        return True
+    except Exception as e:
+        output_handler.log(f"Ошибка при построении поискового индекса: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def fts_query(text):
+    """Преобразование пользовательской строки в запрос FTS5
+
+    Каждое слово ищется по префиксу, чтобы "ракели" находило "ракель" при вводе "ракел"
+    и "P1005" находило "P1005n".
+    """
+    return " ".join(f'"{token}"*' for token in TOKEN_RE.findall(text))
+
+def search(index_path, text=None, attributes=None, in_stock=False, limit=50):
+    """Поиск товаров
+
+    text - слова для полнотекстового поиска по наименованию, характеристикам и описанию;
+    attributes - словарь {ключ характеристики: подстрока значения};
+    in_stock - только товары с ненулевым наличием.
+    Возвращает список словарей, отсортированный по релевантности.
+    """
+    conditions = []
+    params = []
+    query = "SELECT p.id, p.name, p.availability, p.in_transit, p.wholesale_price, p.retail_price, p.source FROM products p"
+
+    match = fts_query(text) if text else ""
+    if match:
+        query += " JOIN products_fts f ON f.id = p.id"
+        conditions.append("products_fts MATCH ?")
+        params.append(match)
+    for key, value in (attributes or {}).items():
+        conditions.append("EXISTS (SELECT 1 FROM characteristics c WHERE c.product_id = p.id AND c.key = ? AND c.value LIKE ?)")
+        params.extend([key, f"%{value}%"])
+    if in_stock:
+        conditions.append("p.availability > 0")
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    # bm25: по наименованию совпадение весит больше, чем по описанию
+    query += " ORDER BY bm25(products_fts, 0, 10.0, 3.0, 1.0)" if match else " ORDER BY p.name"
+    query += " LIMIT ?"
+    params.append(limit)
+
+    columns = ("id", "name", "availability", "in_transit", "wholesale_price", "retail_price", "source")
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        return [dict(zip(columns, row)) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+def get_characteristics(index_path, product_id):
+    """Характеристики товара из индекса"""
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute("SELECT key, value FROM characteristics WHERE product_id = ?", (product_id,)))
+    finally:
+        conn.close()
+
+def search_main():
+    """Консольный поиск по индексу"""
+    import argparse
+    import time
+    from comcenter_parser import search_index_file, search_index_sources, ConsoleOutputHandler
+    parser = argparse.ArgumentParser(description="Поиск по базе товаров Comcenter")
+    parser.add_argument("text", nargs="*", help="слова для поиска, например: ракель P1005")
+    parser.add_argument("-a", "--attr", action="append", default=[], metavar="КЛЮЧ=ЗНАЧЕНИЕ",
+                        help="фильтр по характеристике, например: \"Тип товара=Ракель\"")
+    parser.add_argument("--in-stock", action="store_true", help="только товары в наличии")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--rebuild", action="store_true", help="перестроить индекс перед поиском")
+    args = parser.parse_args()
+
+    if args.rebuild or not os.path.exists(search_index_file):
+        build_search_index(search_index_sources, search_index_file, ConsoleOutputHandler())
+
+    attributes = dict(item.split("=", 1) for item in args.attr)
+    start = time.perf_counter()
+    results = search(search_index_file, " ".join(args.text), attributes, args.in_stock, args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for item in results:
+        print(f"{item['id']}  {item['availability']:>5}  {item['retail_price']:>10.2f}  {item['name']}")
+    print(f"Найдено: {len(results)} ({elapsed:.1f} мс)")
+
+if __name__ == "__main__":
+    search_main()
@@ -0,0 +1,264 @@
+import os
+import re
+import threading
+import time
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from comcenter_compact import CompactCompatibility, ProductTable, int_to_id, load_cached
+from comcenter_jsonio import dumps
+from comcenter_parser import (
+    ConsoleOutputHandler, compatibility_output_file, all_cartridges_parts_output_file,
+    cartridges_parts_output_file, comcenter_products_output_file,
+)
+
+# Локальный HTTP/JSON-сервис только для чтения: базы загружаются один раз в память
+# и перечитываются, когда парсер публикует новые файлы. Базы хранятся в компактном
+# виде (comcenter_compact: совместимость - CSR принтер -> расходники и товар -> принтеры,
+# товары - ProductTable по столбцам) и загружаются из бинарного кэша рядом с JSON,
+# пока тот не изменился. Запросы:
+#   GET /printers/{ID}[?in_stock=1]  - картриджи и запчасти для принтера
+#   GET /products/{ID}               - данные товара
+#   GET /products/{ID}/printers      - принтеры, с которыми совместим товар
+#   GET /status                      - загруженные файлы и размеры индексов
+
+# Базы товаров (при совпадении ID приоритет у последней)
+product_sources = [all_cartridges_parts_output_file, cartridges_parts_output_file, comcenter_products_output_file]
+
+request_re = re.compile(r'^/(printers|products)/(\d{12})(/printers)?/?$')
+
+default_host = "127.0.0.1"
+default_port = 8765
+reload_interval = 10
+
+def request_key(path, query_string):
+    """Нормализованный запрос (он же ключ кэша ответов) или None для неизвестного пути
+
+    Из строки запроса учитывается только in_stock и только для /printers/{ID},
+    поэтому посторонние параметры не порождают новых записей в кэше.
+    """
+    if path == "/status":
+        return ("status",)
+    match = request_re.match(path)
+    if not match:
+        return None
+    kind, object_id, printers_suffix = match.groups()
+    if kind == "printers" and not printers_suffix:
+        in_stock = parse_qs(query_string).get("in_stock", ["0"])[0] in ("1", "true")
+        return ("printer", object_id, in_stock)
+    if kind == "products" and printers_suffix:
+        return ("product_printers", object_id)
+    if kind == "products":
+        return ("product", object_id)
+    return None
+
+class CatalogStore:
+    """Неизменяемый снимок баз с индексами для поиска
+
+    products - ProductTable по базам товаров в порядке product_sources (при совпадении
+    ID приоритет у последней), compatibility - CompactCompatibility.
+    """
+    def __init__(self, products, compatibility):
+        self.products = products
+        self.compatibility = compatibility
+        self.loaded_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self.product_count = len(set().union(*(table.ids for table in products)))
+        # Готовые ответы в JSON: каждый снимок кодирует ответ на запрос не более одного раза
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, product_files, compatibility_file):
+        """Загрузка баз; ошибки разбора не перехватываются, чтобы не подменить снимок пустым"""
+        products = [load_cached(ProductTable, path) for path in product_files if os.path.exists(path)]
+        if os.path.exists(compatibility_file):
+            compatibility = load_cached(CompactCompatibility, compatibility_file)
+        else:
+            compatibility = CompactCompatibility.from_json({})
+        return cls(products, compatibility)
+
+    @classmethod
+    def empty(cls):
+        return cls([], CompactCompatibility.from_json({}))
+
+    def record(self, product_id):
+        """ProductRecord товара из базы с наибольшим приоритетом или None"""
+        for table in reversed(self.products):
+            record = table.get(product_id)
+            if record is not None:
+                return record
+        return None
+
+    def product_ids(self):
+        """ID всех товаров снимка"""
+        return sorted({int_to_id(value) for table in self.products for value in table.ids})
+
+    def summary(self, product_id):
+        """Товар в списке расходников принтера"""
+        for table in reversed(self.products):
+            summary = table.summary(product_id)
+            if summary is not None:
+                return {"id": product_id, **summary}
+        return {"id": product_id}
+
+    def printer(self, printer_id, in_stock=False):
+        entry = self.compatibility.entry(printer_id)
+        if entry is None:
+            return None
+        cartridges, parts = entry
+
+        def items(ids):
+            result = [self.summary(product_id) for product_id in ids]
+            if in_stock:
+                result = [item for item in result if (item.get("availability") or 0) > 0]
+            return result
+
+        return {"printer_id": printer_id, "cartridges": items(cartridges), "parts": items(parts)}
+
+    def product(self, product_id):
+        record = self.record(product_id)
+        if record is None:
+            return None
+        return {"id": product_id, **record.to_json(), "printers": self.compatibility.printers_for(product_id)}
+
+    def printers_for_product(self, product_id):
+        printers = self.compatibility.printers_for(product_id)
+        if not printers and self.record(product_id) is None:
+            return None
+        return {"product_id": product_id, "printers": printers}
+
+    def status(self):
+        return {
+            "loaded_at": self.loaded_at,
+            "products": self.product_count,
+            "printers": len(self.compatibility),
+            "compatible_products": len(self.compatibility.product_ids),
+        }
+
+    def route(self, key):
+        """Ответ на нормализованный запрос (см. request_key): (код, данные)"""
+        if key is None:
+            return 404, {"error": "неизвестный запрос"}
+        kind, *args = key
+        if kind == "status":
+            return 200, self.status()
+        if kind == "printer":
+            data = self.printer(*args)
+        elif kind == "product_printers":
+            data = self.printers_for_product(*args)
+        else:
+            data = self.product(*args)
+        if data is None:
+            return 404, {"error": f"ID {args[0]} не найден"}
+        return 200, data
+
+    def response(self, path, query_string):
+        """Закодированный ответ с кэшированием
+
+        Кэшируются только успешные ответы по существующим ID, так что размер кэша
+        ограничен размером баз.
+        """
+        key = request_key(path, query_string)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        status, data = self.route(key)
+        body = dumps(data, compact=True)
+        if status == 200 and key[0] != "status":
+            with self.cache_lock:
+                self.cache[key] = (status, body)
+        return status, body
+
+class CatalogService:
+    """Текущий снимок баз и его перезагрузка при изменении файлов"""
+    def __init__(self, output_handler, product_files=None, compatibility_file=compatibility_output_file):
+        self.output_handler = output_handler
+        self.product_files = list(product_files or product_sources)
+        self.compatibility_file = compatibility_file
+        self.mtimes = None
+        self.store = None
+        self.reload_if_changed()
+
+    def source_mtimes(self):
+        return tuple(
+            os.path.getmtime(path) if os.path.exists(path) else None
+            for path in self.product_files + [self.compatibility_file]
+        )
+
+    def reload_if_changed(self):
+        mtimes = self.source_mtimes()
+        if mtimes == self.mtimes:
+            return False
+        start = time.perf_counter()
+        try:
+            store = CatalogStore.load(self.product_files, self.compatibility_file)
+        except Exception as e:
+            # Файл мог быть прочитан в момент записи - остается предыдущий снимок, повтор при следующей проверке
+            self.output_handler.log(f"Ошибка при загрузке баз, используется предыдущий снимок: {e}")
+            if self.store is None:
+                self.store = CatalogStore.empty()
+            return False
+        # Замена ссылки атомарна: текущие запросы дорабатывают со старым снимком
+        self.store = store
+        self.mtimes = mtimes
+        self.output_handler.log(
+            f"Базы загружены за {time.perf_counter() - start:.2f} с: товаров {store.product_count}, "
+            f"принтеров {len(store.compatibility)}"
+        )
+        return True
+
+    def watch(self, interval=reload_interval):
+        """Фоновая проверка файлов на изменения"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    self.output_handler.log(f"Ошибка при перезагрузке баз: {e}")
+        threading.Thread(target=loop, daemon=True).start()
+
+def make_server(service, host=default_host, port=default_port):
+    """HTTP-сервер поверх CatalogService"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            status, body = service.store.response(url.path, url.query)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+def service_main():
+    """Запуск сервиса из консоли"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Локальный сервис запросов к базам Comcenter")
+    parser.add_argument("--host", default=default_host)
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--reload-interval", type=int, default=reload_interval, help="проверка обновления файлов, с")
+    args = parser.parse_args()
+
+    output_handler = ConsoleOutputHandler()
+    service = CatalogService(output_handler)
+    service.watch(args.reload_interval)
+    server = make_server(service, args.host, args.port)
+    output_handler.log(f"Сервис запущен: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        output_handler.log("Сервис остановлен")
+
+if __name__ == "__main__":
+    service_main()
@@ -0,0 +1,158 @@
+import random
+import unittest
+
+from bs4 import BeautifulSoup
+
+import comcenter_parser as cp
+from comcenter_metrics import RunMetrics
+
+# Быстрое извлечение наличия и цен (fetch_prices_fast) должно давать то же, что
+# parse_product_page, при любом разбиении страницы на фрагменты; если быстрый способ
+# не может это гарантировать, он должен вернуть None (полный разбор страницы)
+
+PRICE = b'<div class="product-price-container"><span data-bind="text: getBrowsingPrice(12.50, 10)"></span></div>'
+
+PAGES = {
+    "simple": b'<html><body>' + b'<p>text</p>' * 100 + b'<span class="a product-count b"> 17 </span>' + PRICE,
+    "non_numeric_first": b'<span class="product-count">n/a</span><span class="product-count">5</span>' + PRICE,
+    "similar_class": b'<span class="product-count-label">9</span><span class="product-count">3</span>' + PRICE,
+    "marker_in_script": b'<script>var c = "product-count";</script><span class="product-count">4</span>' + PRICE,
+    "div_first": b'<div class="product-count">8</div><span class="product-count">6</span>' + PRICE,
+    "nested_count": b'<span class="product-count"><b>7</b></span>' + PRICE,
+    "no_count": b'<p>nothing</p>' + PRICE,
+    "nested_container": (
+        b'<span class="product-count">2</span><div class="product-price-container"><div class="row">'
+        b'<div><span data-bind="text: getBrowsingPrice(99.90, 80.5)"></span></div></div></div>'
+    ),
+    # Контейнер цен без цены, цена другого товара ниже (блок похожих товаров)
+    "price_outside_container": (
+        b'<span class="product-count">1</span><div class="product-price-container"><div>-</div></div>'
+        b'<div class="related"><span data-bind="text: getBrowsingPrice(55.00, 44)"></span></div>'
+    ),
+    "no_container": b'<span class="product-count">1</span><span data-bind="text: getBrowsingPrice(55.00, 44)"></span>',
+}
+
+class FakeRaw:
+    def __init__(self, response):
+        self.response = response
+
+    def tell(self):
+        return self.response.wire_bytes
+
+class FakeResponse:
+    """Ответ requests с потоковым телом, разбитым на заданные фрагменты"""
+    def __init__(self, chunks, content_length=None, wire_ratio=1.0):
+        self.chunks = chunks
+        self.headers = {"Content-Length": str(content_length)} if content_length is not None else {}
+        self.wire_ratio = wire_ratio
+        self.wire_bytes = 0
+        self.drained = False
+        self.raw = FakeRaw(self)
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i, chunk in enumerate(self.chunks):
+            if i == len(self.chunks) - 1:
+                self.drained = True
+            self.wire_bytes += int(len(chunk) * self.wire_ratio)
+            yield chunk
+
+    def close(self):
+        pass
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, *args, **kwargs):
+        return self.response
+
+class Handler:
+    def log(self, message):
+        pass
+
+def split(body, sizes):
+    chunks = []
+    pos = 0
+    for size in sizes:
+        if pos >= len(body):
+            break
+        chunks.append(body[pos:pos + size])
+        pos += size
+    if pos < len(body):
+        chunks.append(body[pos:])
+    return chunks
+
+def fetch(chunks, **kwargs):
+    response = FakeResponse(chunks, **kwargs)
+    data, body = cp.fetch_prices_fast(FakeSession(response), "url", {}, RunMetrics("test"))
+    return data, body, response
+
+expected_cache = {}
+
+def expected(body):
+    if body in expected_cache:
+        return expected_cache[body]
+    record = cp.parse_product_page(BeautifulSoup(body, 'html.parser'), "000000000000", {}, Handler())
+    result = expected_cache[body] = {key: record[key] for key in ("availability", "retail_price", "wholesale_price")}
+    return result
+
+class FetchPricesFastTest(unittest.TestCase):
+    def check_page(self, name, body, chunks):
+        data, returned, _ = fetch(chunks)
+        if data is None:
+            # Полный разбор получает страницу целиком
+            self.assertEqual(returned, body, name)
+        else:
+            self.assertEqual(data, expected(body), name)
+        return data
+
+    def test_matches_parse_product_page_for_every_chunk_size(self):
+        for name, body in PAGES.items():
+            for size in (1, 2, 3, 5, 7, 16, 64, len(body)):
+                with self.subTest(page=name, size=size):
+                    self.check_page(name, body, split(body, [size] * len(body)))
+
+    def test_matches_parse_product_page_for_random_splits(self):
+        rng = random.Random(1)
+        for name, body in PAGES.items():
+            for _ in range(50):
+                sizes = [rng.randint(1, 40) for _ in range(len(body))]
+                with self.subTest(page=name, sizes=sizes[:10]):
+                    self.check_page(name, body, split(body, sizes))
+
+    def test_every_single_split_point(self):
+        for name, body in PAGES.items():
+            for cut in range(1, len(body)):
+                with self.subTest(page=name, cut=cut):
+                    self.check_page(name, body, [body[:cut], body[cut:]])
+
+    def test_fast_path_results(self):
+        fast = {name: fetch([body])[0] for name, body in PAGES.items()}
+        self.assertEqual(fast["simple"], {"availability": 17, "retail_price": 12.5, "wholesale_price": 10.0})
+        self.assertEqual(fast["non_numeric_first"]["availability"], 0)
+        self.assertEqual(fast["similar_class"]["availability"], 3)
+        self.assertEqual(fast["nested_container"]["retail_price"], 99.9)
+        # Цена вне контейнера не берется - полный разбор
+        self.assertIsNone(fast["price_outside_container"])
+        self.assertIsNone(fast["no_container"])
+        self.assertIsNone(fast["nested_count"])
+
+    def test_small_remainder_is_drained_by_wire_bytes(self):
+        body = PAGES["simple"] + b'<p>tail</p>' * 100
+        chunks = split(body, [1024] * len(body))
+        # Сжатая передача: Content-Length меньше распакованного тела
+        data, _, response = fetch(chunks, content_length=len(body) // 3, wire_ratio=1 / 3)
+        self.assertIsNotNone(data)
+        self.assertTrue(response.drained)
+
+    def test_large_remainder_is_not_downloaded(self):
+        body = PAGES["simple"] + b'<p>tail</p>' * 50000
+        data, _, response = fetch(split(body, [1024] * len(body)), content_length=len(body))
+        self.assertIsNotNone(data)
+        self.assertFalse(response.drained)
+
+if __name__ == "__main__":
+    unittest.main()